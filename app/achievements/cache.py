@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from common.osu_api import redis_client
+
+import json
+import threading
+import time
+from typing import Any, Callable
+
+
+__all__ = (
+    "KEY_ACHIEVEMENTS_VERSION",
+    "get_achievements_version",
+    "bump_achievements_version",
+    "get_achievements_payload",
+    "get_decoded_achievements_payload",
+    "get_cached_effective_team_count",
+)
+
+
+# the score server records completions on its own, so it
+# should INCR this key as well whenever it creates one
+KEY_ACHIEVEMENTS_VERSION = "achievements-version:{iteration_id}"
+KEY_ACHIEVEMENTS_PAYLOAD = "achievements-payload:{iteration_id}:{version}:{variant}"
+KEY_EFFECTIVE_TEAM_COUNT = "effective-team-count:{iteration_id}"
+
+# bumping the version deletes the cached count, but completions recorded by the score
+# server don't always bump it, so the count can be stale for up to this many seconds
+EFFECTIVE_TEAM_COUNT_TTL = 30
+
+# how long a worker may spend building a payload before others stop waiting on it
+BUILD_LOCK_TIMEOUT = 10
+BUILD_WAIT_INTERVAL = 0.05
+BUILD_WAIT_ATTEMPTS = 100
+
+# payloads that are decoded and prepared once per process, {redis key: (expires at, data)}
+_decoded_payloads: dict[str, tuple[float, Any]] = {}
+_decoded_payloads_lock = threading.Lock()
+
+
+def _encode(data: Any) -> bytes:
+    # same encoding JsonResponse uses
+    return json.dumps(data, cls=DjangoJSONEncoder).encode("utf-8")
+
+
+def get_achievements_version(iteration_id: int) -> int:
+    version = redis_client.get(KEY_ACHIEVEMENTS_VERSION.format(iteration_id=iteration_id))
+    return 0 if version is None else int(version)
+
+
+def bump_achievements_version(*iteration_ids: int | None):
+    """Invalidate the cached achievements payloads and effective team count of the given iterations"""
+    if settings.DEBUG:
+        return
+
+    for iteration_id in set(iteration_ids):
+        if iteration_id is not None:
+            redis_client.incr(KEY_ACHIEVEMENTS_VERSION.format(iteration_id=iteration_id))
+            redis_client.delete(KEY_EFFECTIVE_TEAM_COUNT.format(iteration_id=iteration_id))
+
+
+def _payload_key(iteration_id: int, variant: str) -> str:
+    return KEY_ACHIEVEMENTS_PAYLOAD.format(
+        iteration_id=iteration_id, version=get_achievements_version(iteration_id), variant=variant
+    )
+
+
+def get_achievements_payload(iteration_id: int, variant: str, build: Callable[[], Any], ttl: int) -> bytes:
+    """
+    Returns the json encoded result of `build`, reusing the one stored for this
+    iteration and variant until the iteration's version is bumped or `ttl` runs out.
+    """
+    if settings.DEBUG:
+        return _encode(build())
+
+    return _get_payload(_payload_key(iteration_id, variant), build, ttl)
+
+
+def _get_payload(key: str, build: Callable[[], Any], ttl: int) -> bytes:
+    if (payload := redis_client.get(key)) is not None:
+        return payload
+
+    # only one worker builds a payload at a time; lots of
+    # clients poll at once when a batch gets released
+    lock_key = key + ":building"
+    is_building = bool(redis_client.set(lock_key, 1, nx=True, ex=BUILD_LOCK_TIMEOUT))
+    if not is_building:
+        for _ in range(BUILD_WAIT_ATTEMPTS):
+            time.sleep(BUILD_WAIT_INTERVAL)
+            if (payload := redis_client.get(key)) is not None:
+                return payload
+
+    try:
+        payload = _encode(build())
+        redis_client.set(key, payload, ex=ttl)
+    finally:
+        if is_building:
+            redis_client.delete(lock_key)
+
+    return payload
+
+
+def get_cached_effective_team_count(iteration_id: int, count: Callable[[], int]) -> int:
+    if settings.DEBUG:
+        return count()
+
+    key = KEY_EFFECTIVE_TEAM_COUNT.format(iteration_id=iteration_id)
+    if (n_teams := redis_client.get(key)) is not None:
+        return int(n_teams)
+
+    n_teams = count()
+    redis_client.set(key, n_teams, ex=EFFECTIVE_TEAM_COUNT_TTL)
+    return n_teams
+
+
+def get_decoded_achievements_payload(
+    iteration_id: int, variant: str, build: Callable[[], Any], ttl: int, prepare: Callable[[Any], Any]
+) -> Any:
+    """
+    Like get_achievements_payload, but returns `prepare` applied to the decoded payload.
+    The result is kept in this process for the same version, so it must not be modified.
+    """
+    if settings.DEBUG:
+        return prepare(json.loads(_encode(build())))
+
+    key = _payload_key(iteration_id, variant)
+    now = time.monotonic()
+    with _decoded_payloads_lock:
+        entry = _decoded_payloads.get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    data = prepare(json.loads(_get_payload(key, build, ttl)))
+    with _decoded_payloads_lock:
+        # entries of older versions are left to expire
+        for old_key in [old_key for old_key, (expires_at, _) in _decoded_payloads.items() if expires_at <= now]:
+            del _decoded_payloads[old_key]
+        _decoded_payloads[key] = (now + ttl, data)
+
+    return data
@@ -0,0 +1,114 @@
+from django.conf import settings
+
+from common.osu_api import redis_client
+from .models import Team, Player
+
+
+__all__ = (
+    "rebuild_leaderboard",
+    "invalidate_leaderboard",
+    "update_leaderboard_points",
+    "get_leaderboard_position",
+)
+
+
+# team id -> points
+KEY_LEADERBOARD = "leaderboard:{iteration_id}"
+# user id -> team id
+KEY_LEADERBOARD_PLAYERS = "leaderboard-players:{iteration_id}"
+# always present in the players hash, so an iteration with no players still counts as built
+BUILT_FIELD = "built"
+
+# the score server changes points without going through here,
+# so the index is rebuilt from the database every so often
+LEADERBOARD_TTL = 15
+
+
+def _keys(iteration_id: int) -> tuple[str, str]:
+    return (
+        KEY_LEADERBOARD.format(iteration_id=iteration_id),
+        KEY_LEADERBOARD_PLAYERS.format(iteration_id=iteration_id),
+    )
+
+
+def rebuild_leaderboard(iteration_id: int):
+    if settings.DEBUG:
+        return
+
+    teams = dict(Team.objects.filter(iteration_id=iteration_id).values_list("id", "points"))
+    players = dict(Player.objects.filter(team__iteration_id=iteration_id).values_list("user_id", "team_id"))
+    players[BUILT_FIELD] = 1
+
+    leaderboard_key, players_key = _keys(iteration_id)
+    pipe = redis_client.pipeline()
+    pipe.delete(leaderboard_key, players_key)
+    if len(teams) > 0:
+        pipe.zadd(leaderboard_key, teams)
+        pipe.expire(leaderboard_key, LEADERBOARD_TTL)
+    pipe.hset(players_key, mapping=players)
+    pipe.expire(players_key, LEADERBOARD_TTL)
+    pipe.execute()
+
+
+def invalidate_leaderboard(iteration_id: int):
+    """Should be called when teams are created/deleted or players join/leave them"""
+    if settings.DEBUG:
+        return
+
+    redis_client.delete(*_keys(iteration_id))
+
+
+def update_leaderboard_points(iteration_id: int, team_points: dict[int, int]):
+    if settings.DEBUG or len(team_points) == 0:
+        return
+
+    # xx: teams missing from the index get added back on the next rebuild
+    redis_client.zadd(KEY_LEADERBOARD.format(iteration_id=iteration_id), team_points, xx=True)
+
+
+def _get_position_from_db(iteration_id: int, user_id: int) -> tuple[int, int, list[int]] | None:
+    team_id = (
+        Player.objects.filter(user_id=user_id, team__iteration_id=iteration_id)
+        .values_list("team_id", flat=True)
+        .first()
+    )
+    if team_id is None:
+        return
+
+    team_ids = list(Team.objects.filter(iteration_id=iteration_id).order_by("-points").values_list("id", flat=True))
+    rank = team_ids.index(team_id)
+    return rank, team_id, team_ids[max(rank - 1, 0) : rank + 2]
+
+
+def get_leaderboard_position(iteration_id: int, user_id: int) -> tuple[int, int, list[int]] | None:
+    """
+    Returns the rank (0-indexed) of the user's team, the team's id, and the ids of the
+    team directly above it, itself and the team directly below it (in that order)
+    """
+    if settings.DEBUG:
+        return _get_position_from_db(iteration_id, user_id)
+
+    leaderboard_key, players_key = _keys(iteration_id)
+    for _ in range(2):
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.exists(players_key)
+        pipe.hget(players_key, user_id)
+        is_built, team_id = pipe.execute()
+        if not is_built:
+            rebuild_leaderboard(iteration_id)
+            continue
+
+        if team_id is None:
+            return
+
+        team_id = int(team_id)
+        rank = redis_client.zrevrank(leaderboard_key, team_id)
+        if rank is None:
+            # expired or invalidated since the lookup above
+            rebuild_leaderboard(iteration_id)
+            continue
+
+        team_ids = list(map(int, redis_client.zrevrange(leaderboard_key, max(rank - 1, 0), rank + 1)))
+        return rank, team_id, team_ids
+
+    return _get_position_from_db(iteration_id, user_id)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from achievements.models import EventIteration, Team
+from achievements.scoring import recalculate_team_points
+
+
+class Command(BaseCommand):
+    help = "Recalculate and save the points of every team in an iteration"
+
+    def add_arguments(self, parser):
+        parser.add_argument("iteration_id", type=int, nargs="?", default=None)
+
+    def handle(self, *args, **options):
+        iteration_id = options["iteration_id"]
+        if iteration_id is None:
+            iteration_id = EventIteration.objects.order_by("-id").values_list("id", flat=True).first()
+
+        engine = recalculate_team_points(iteration_id)
+
+        names = dict(Team.objects.filter(iteration_id=iteration_id).values_list("id", "name"))
+        self.stdout.write(f"Effective team count: {engine.n_teams}")
+        self.stdout.write("| %32s | %6s |" % ("Team", "Points"))
+        self.stdout.write("|----------------------------------|--------|")
+        for team_id, points in sorted(engine.team_points.items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write("| %32s | %6s |" % (names.get(team_id, team_id), points))
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.6 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+def delete_duplicate_ratings(apps, schema_editor):
+    Achievement = apps.get_model("achievements", "Achievement")
+    AchievementRating = apps.get_model("achievements", "AchievementRating")
+
+    # keep the newest rating of each user
+    duplicates = (
+        AchievementRating.objects.values("achievement_id", "user_id")
+        .annotate(count=models.Count("id"), newest=models.Max("id"))
+        .filter(count__gt=1)
+    )
+    achievement_ids = set()
+    for duplicate in duplicates:
+        AchievementRating.objects.filter(
+            achievement_id=duplicate["achievement_id"], user_id=duplicate["user_id"], id__lt=duplicate["newest"]
+        ).delete()
+        achievement_ids.add(duplicate["achievement_id"])
+
+    for achievement_id in achievement_ids:
+        result = AchievementRating.objects.filter(achievement_id=achievement_id).aggregate(
+            avg_quality=models.Avg("quality"),
+            avg_difficulty=models.Avg("difficulty"),
+            upvotes=models.Count("id", filter=models.Q(upvoted=True)),
+        )
+        Achievement.objects.filter(id=achievement_id).update(
+            avg_quality_rating=result["avg_quality"],
+            avg_difficulty_rating=result["avg_difficulty"],
+            upvotes=result["upvotes"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("achievements", "0059_achievement_solution_parts_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="achievementrating",
+            constraint=models.UniqueConstraint(fields=("achievement", "user"), name="unique_achievement_rating"),
+        ),
+    ]
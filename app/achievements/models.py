@@ -2,10 +2,10 @@ import time
 
 import requests
 
-from django.db import models
+from django.db import models, transaction
 
 from common.serializer import SerializableModel
-from common.osu_api import get_user_client, get_client
+from common.osu_api import get_user_client, get_client, get_beatmaps_data
 
 
 class UserManager(models.Manager):
@@ -105,39 +105,41 @@ class BeatmapInfo(SerializableModel):
     star_rating = models.FloatField()
 
     @classmethod
-    def _get_or_create(cls, info):
-        beatmap = BeatmapInfo.objects.filter(id=info.id).first()
-        if beatmap is None:
-            beatmap = BeatmapInfo.objects.create(
-                id=info.id,
-                artist=info.beatmapset.artist,
-                title=info.beatmapset.title,
-                version=info.version,
-                cover=info.beatmapset.covers.cover,
-                star_rating=info.difficulty_rating,
-            )
-        else:
-            beatmap.artist = info.beatmapset.artist
-            beatmap.title = info.beatmapset.title
-            beatmap.version = info.version
-            beatmap.cover = info.beatmapset.covers.cover
-            beatmap.star_rating = info.difficulty_rating
-            beatmap.save()
-
-        return beatmap
+    def _from_info(cls, info):
+        return cls(
+            id=info["id"],
+            artist=info["beatmapset"]["artist"],
+            title=info["beatmapset"]["title"],
+            version=info["version"],
+            cover=info["beatmapset"]["covers"]["cover"],
+            star_rating=info["difficulty_rating"],
+        )
+
+    @classmethod
+    def fetch_data(cls, beatmap_ids) -> list[dict] | None:
+        """Beatmap data from the api, None if any of the ids are invalid"""
+        beatmaps = get_beatmaps_data(beatmap_ids)
+        return beatmaps if len(beatmaps) == len(beatmap_ids) else None
+
+    @classmethod
+    def bulk_upsert(cls, infos):
+        # one INSERT ... ON CONFLICT DO UPDATE for every beatmap
+        return cls.objects.bulk_create(
+            list(map(cls._from_info, infos)),
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=["artist", "title", "version", "cover", "star_rating"],
+        )
 
     @classmethod
     def get_or_create(cls, beatmap_id):
-        info = get_client().get_beatmap(beatmap_id)
-        return cls._get_or_create(info)
+        beatmaps = cls.bulk_get_or_create([beatmap_id])
+        return None if beatmaps is None else beatmaps[0]
 
     @classmethod
     def bulk_get_or_create(cls, beatmap_ids):
-        beatmaps = get_client().get_beatmaps(beatmap_ids)
-        if len(beatmaps) != len(beatmap_ids):
-            return
-
-        return list(map(cls._get_or_create, beatmaps))
+        beatmaps = cls.fetch_data(beatmap_ids)
+        return None if beatmaps is None else cls.bulk_upsert(beatmaps)
 
     class Serialization:
         FIELDS = ["id", "artist", "version", "title", "cover", "star_rating"]
@@ -184,6 +186,41 @@ class BeatmapConnection(SerializableModel):
     info = models.ForeignKey(BeatmapInfo, on_delete=models.CASCADE)
     hide = models.BooleanField(default=False)
 
+    @classmethod
+    def bulk_set(cls, achievement_id, beatmaps):
+        """
+        Make the achievement's connections match `beatmaps`, a list of (BeatmapInfo, hide) pairs.
+        Returns the connections in the same order.
+        """
+        connections = []
+        to_create = []
+        to_update = []
+        with transaction.atomic():
+            existing = {
+                connection.info_id: connection
+                for connection in cls.objects.select_for_update().filter(achievement_id=achievement_id)
+            }
+            stale = existing.keys() - {info.id for info, _ in beatmaps}
+            if len(stale) > 0:
+                cls.objects.filter(achievement_id=achievement_id, info_id__in=stale).delete()
+
+            for info, hide in beatmaps:
+                connection = existing.get(info.id)
+                if connection is None:
+                    connection = cls(achievement_id=achievement_id, info=info, hide=hide)
+                    to_create.append(connection)
+                elif connection.hide != hide:
+                    connection.hide = hide
+                    to_update.append(connection)
+
+                connection.info = info
+                connections.append(connection)
+
+            cls.objects.bulk_create(to_create)
+            cls.objects.bulk_update(to_update, ["hide"])
+
+        return connections
+
     class Serialization:
         FIELDS = ["hide"]
 
@@ -241,6 +278,11 @@ class AchievementRating(SerializableModel):
     quality = models.PositiveSmallIntegerField(default=None, null=True)
     difficulty = models.PositiveSmallIntegerField(default=None, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["achievement", "user"], name="unique_achievement_rating"),
+        ]
+
     class Serialization:
         FIELDS = ["upvoted", "quality", "difficulty"]
 
@@ -0,0 +1,328 @@
+"""
+Team points, implemented as specified in this desmos https://www.desmos.com/calculator/d4a6d8d7e9
+(the same formula calculate_score_independently.py uses with data from the public api)
+"""
+
+from django.db import transaction
+
+from .models import AchievementCompletion, Team
+from .leaderboard import update_leaderboard_points
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+import math
+import threading
+
+
+__all__ = (
+    "ScoreEngine",
+    "PointsTable",
+    "get_points_table",
+    "get_achievement_type",
+    "get_time_placements",
+    "recalculate_team_points",
+)
+
+
+COMPETITION = "competition"
+SECRET = "secret"
+NORMAL = "normal"
+
+# completions within this long of the previous one share its time placement
+TIME_PLACEMENT_WINDOW = timedelta(minutes=5)
+
+c0 = -math.atanh(0.7)
+c1 = math.atanh(0.97)
+
+
+def calculate_a(x):
+    return (1.0 - math.tanh(x)) / 2.0
+
+
+def calculate_b(x):
+    return (calculate_a((c1 - c0) * x + c0) - calculate_a(c1)) / (calculate_a(c0) - calculate_a(c1))
+
+
+def _scale(x, n_teams):
+    # with a single team every placement is the first one
+    return 0.0 if n_teams <= 1 else (x - 1) / (n_teams - 1)
+
+
+# the curves in terms of b, so lookup tables
+# can reuse b values and still match exactly
+def _curve_f(b):
+    return 10 + 90 * (b**2)
+
+
+def _curve_g(bx, by):
+    return 10 + 20 * (bx**2) + 70 * (by**2)
+
+
+def _curve_h(b):
+    return 10 + 90 * (b**3)
+
+
+def calculate_f(x, n_teams):
+    return _curve_f(calculate_b(_scale(x, n_teams)))
+
+
+def calculate_g(x, y, n_teams):
+    return _curve_g(calculate_b(_scale(x, n_teams)), calculate_b(_scale(y, n_teams)))
+
+
+def calculate_h(x, n_teams):
+    return _curve_h(calculate_b(_scale(x, n_teams)))
+
+
+def calculate_p(x, n_teams):
+    return round(max(calculate_f(x, n_teams), 10))
+
+
+def calculate_ps(x, y, n_teams):
+    return round(max(calculate_g(x, y, n_teams), 10))
+
+
+def calculate_pc(x, n_teams):
+    return round(max(calculate_h(x, n_teams), 10))
+
+
+class PointsTable:
+    """
+    calculate_p, calculate_ps and calculate_pc precomputed for every
+    placement/completion count at one effective team count.
+    Tables are shared between threads, so they only grow while holding the lock.
+    """
+
+    __slots__ = ("n_teams", "_b", "_normal", "_competition", "_secret", "_lock")
+
+    def __init__(self, n_teams: int):
+        self.n_teams: int = n_teams
+        # indexed by placement/completion count; index 0 is unused
+        self._b: list[float] = [0.0]
+        self._normal: list[int] = [0]
+        self._competition: list[int] = [0]
+        # total completions -> points by time placement
+        self._secret: dict[int, list[int]] = {}
+        self._lock: threading.RLock = threading.RLock()
+
+        self._extend(max(n_teams, 1))
+
+    def _extend(self, size: int):
+        # counts can go past the team count (e.g. several players of a team
+        # completing the same achievement), so tables grow when needed
+        with self._lock:
+            for x in range(len(self._b), size + 1):
+                b = calculate_b(_scale(x, self.n_teams))
+                self._b.append(b)
+                self._normal.append(round(max(_curve_f(b), 10)))
+                self._competition.append(round(max(_curve_h(b), 10)))
+
+    def normal(self, total_completions: int) -> int:
+        if total_completions >= len(self._normal):
+            self._extend(total_completions)
+        return self._normal[total_completions]
+
+    def competition(self, place: int) -> int:
+        if place >= len(self._competition):
+            self._extend(place)
+        return self._competition[place]
+
+    def secret(self, time_placement: int, total_completions: int) -> int:
+        row = self._secret.get(total_completions)
+        if row is None or time_placement >= len(row):
+            with self._lock:
+                self._extend(max(time_placement, total_completions))
+                by = self._b[total_completions]
+                row = [0] + [round(max(_curve_g(bx, by), 10)) for bx in self._b[1:]]
+                self._secret[total_completions] = row
+        return row[time_placement]
+
+
+@lru_cache(maxsize=2)
+def get_points_table(n_teams: int) -> PointsTable:
+    # only rebuilt when the effective team count changes
+    return PointsTable(n_teams)
+
+
+def get_achievement_type(tags: str) -> str:
+    tags = [tag.strip().lower() for tag in tags.split(",")]
+    if COMPETITION in tags:
+        return COMPETITION
+    if SECRET in tags:
+        return SECRET
+    return NORMAL
+
+
+def get_time_placements(times: list[datetime]) -> list[int]:
+    """Expects `times` to be sorted"""
+    placements = []
+    last_time = None
+    last_placement = 1
+    for i, time in enumerate(times):
+        if last_time is None:
+            placements.append(1)
+        elif time - last_time <= TIME_PLACEMENT_WINDOW:
+            placements.append(last_placement)
+        else:
+            placements.append(i + 1)
+            last_placement = i + 1
+        last_time = time
+
+    return placements
+
+
+class ScoreEngine:
+    """
+    Keeps the completions of an iteration in memory so team points can be calculated from scratch,
+    or updated one completion at a time. Completions are recorded by the score server, not this app,
+    so nothing here calls set_completion yet; recalculate_points recalculates from scratch.
+    """
+
+    __slots__ = (
+        "iteration_id",
+        "team_points",
+        "n_teams",
+        "points_table",
+        "_teams",
+        "_achievements",
+        "_completions",
+        "_contributions",
+    )
+
+    def __init__(self, iteration_id: int):
+        self.iteration_id: int = iteration_id
+        self.team_points: dict[int, int] = defaultdict(int)
+        # effective team count (teams with at least one completion)
+        self.n_teams: int = 0
+        self.points_table: PointsTable = get_points_table(0)
+        self._teams: set[int] = set()
+
+        # achievement id -> (achievement type, worth points)
+        self._achievements: dict[int, tuple[str, bool]] = {}
+        # achievement id -> completion id -> (team id, time completed, place)
+        self._completions: dict[int, dict[int, tuple[int, datetime, int | None]]] = defaultdict(dict)
+        # achievement id -> team id -> points given by that achievement
+        self._contributions: dict[int, dict[int, int]] = {}
+
+    @classmethod
+    def from_iteration(cls, iteration_id: int) -> "ScoreEngine":
+        engine = cls(iteration_id)
+
+        completions = (
+            AchievementCompletion.objects.filter(achievement__batch__iteration_id=iteration_id)
+            .order_by("time_completed")
+            .values_list(
+                "id",
+                "achievement_id",
+                "achievement__tags",
+                "achievement__worth_points",
+                "player__team_id",
+                "time_completed",
+                "placement__place",
+            )
+        )
+        for completion_id, achievement_id, tags, worth_points, team_id, time_completed, place in completions:
+            engine._achievements[achievement_id] = (get_achievement_type(tags), worth_points)
+            engine._completions[achievement_id][completion_id] = (team_id, time_completed, place)
+            engine._teams.add(team_id)
+
+        engine.recalculate()
+        return engine
+
+    def _achievement_points(self, achievement_id: int) -> dict[int, int]:
+        achievement_type, worth_points = self._achievements[achievement_id]
+        points = defaultdict(int)
+        if not worth_points:
+            return points
+
+        completions = sorted(self._completions[achievement_id].values(), key=lambda c: c[1])
+        table = self.points_table
+
+        if achievement_type == COMPETITION:
+            for team_id, _, place in completions:
+                if place is not None:
+                    points[team_id] += table.competition(place)
+        elif achievement_type == SECRET:
+            total_completions = len(completions)
+            time_placements = get_time_placements([time_completed for _, time_completed, _ in completions])
+            for (team_id, _, _), time_placement in zip(completions, time_placements):
+                points[team_id] += table.secret(time_placement, total_completions)
+        else:
+            amount = table.normal(len(completions))
+            for team_id, _, _ in completions:
+                points[team_id] += amount
+
+        return points
+
+    def recalculate(self) -> dict[int, int]:
+        """Calculate every team's points from scratch"""
+        # counted from the completions themselves (like count_effective_teams), since the cached
+        # count the leaderboard shows can be stale, and these points get saved
+        self.n_teams = len(self._teams)
+        self.points_table = get_points_table(self.n_teams)
+        self.team_points.clear()
+        self._contributions.clear()
+
+        for achievement_id in self._completions:
+            self._contributions[achievement_id] = contribution = self._achievement_points(achievement_id)
+            for team_id, points in contribution.items():
+                self.team_points[team_id] += points
+
+        return self.team_points
+
+    def set_completion(self, completion: AchievementCompletion) -> dict[int, int]:
+        """
+        Add a new completion, or update one (e.g. when its placement changes).
+        `completion` needs its achievement, player and placement loaded.
+
+        Returns the new points of the teams whose points changed.
+        """
+        achievement = completion.achievement
+        team_id = completion.player.team_id
+        place = None if completion.placement is None else completion.placement.place
+
+        self._achievements[achievement.id] = (get_achievement_type(achievement.tags), achievement.worth_points)
+        self._completions[achievement.id][completion.id] = (team_id, completion.time_completed, place)
+        self._teams.add(team_id)
+
+        if len(self._teams) != self.n_teams:
+            # every curve depends on the team count
+            prev_points = dict(self.team_points)
+            self.recalculate()
+            return {
+                team_id: points for team_id, points in self.team_points.items() if prev_points.get(team_id) != points
+            }
+
+        # only the points given by this achievement can change
+        prev_contribution = self._contributions.get(achievement.id, {})
+        self._contributions[achievement.id] = contribution = self._achievement_points(achievement.id)
+
+        changed = {}
+        for team_id in prev_contribution.keys() | contribution.keys():
+            diff = contribution.get(team_id, 0) - prev_contribution.get(team_id, 0)
+            if diff != 0:
+                self.team_points[team_id] += diff
+                changed[team_id] = self.team_points[team_id]
+
+        return changed
+
+
+def recalculate_team_points(iteration_id: int) -> ScoreEngine:
+    """Recalculate and save the points of every team in the iteration"""
+    engine = ScoreEngine.from_iteration(iteration_id)
+
+    with transaction.atomic():
+        teams = Team.objects.select_for_update().filter(iteration_id=iteration_id).only("id", "points")
+        changed = []
+        for team in teams:
+            points = engine.team_points.get(team.id, 0)
+            if team.points != points:
+                team.points = points
+                changed.append(team)
+
+        Team.objects.bulk_update(changed, ["points"])
+
+    update_leaderboard_points(iteration_id, {team.id: team.points for team in changed})
+
+    return engine
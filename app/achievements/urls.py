@@ -37,6 +37,7 @@ urlpatterns = (
         path("logout/", common.logout),
         path("admin-login/", admin.login_to_user),
         path("admin/update-iteration-cache/", admin.update_iteration_cache),
+        path("admin/profiling/", admin.get_profiling_stats),
         path("iteration/", common.get_iteration),
         path("iterations/<int:iteration_id>/", common.get_iteration),
         path("invites/<int:invite_id>/rescind/", common.rescind_invite),
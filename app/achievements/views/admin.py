@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 import csv
 import io
+import redis
 
 from django.views.decorators.http import require_POST, require_http_methods, require_GET
 from django.contrib.auth import login as do_login
@@ -11,7 +12,9 @@ from django.conf import settings
 from common.validation import *
 from .util import *
 from common.comm import refresh_achievements_on_server
-from .staff import serialize_full_achievement, with_user_rating
+from common.profiling import get_stats, RETENTION_HOURS
+from .staff import serialize_full_achievement, with_user_rating, get_achievement_iteration_id
+from ..cache import bump_achievements_version
 
 
 discord_logger = settings.DISCORD_LOGGER
@@ -55,6 +58,8 @@ def create_batch(req, data, iteration):
     )
 )
 def change_achievement_batch(req, data, achievement):
+    prev_iteration_id = get_achievement_iteration_id(achievement)
+
     if data["batch_id"] is None:
         achievement.batch = None
         achievement.save()
@@ -71,6 +76,7 @@ def change_achievement_batch(req, data, achievement):
         discord_logger.submit_achievement(req, achievement, "moved")
 
     refresh_achievements_on_server()
+    bump_achievements_version(prev_iteration_id, get_achievement_iteration_id(achievement))
 
     return success(serialize_full_achievement(achievement))
 
@@ -113,3 +119,17 @@ def get_screening_info(req, iteration):
 def update_iteration_cache(req):
     update_current_iteration()
     return HttpResponse("ok")
+
+
+@require_GET
+@require_admin
+def get_profiling_stats(req):
+    try:
+        hours = min(max(int(req.GET.get("hours", 1)), 1), RETENTION_HOURS)
+    except ValueError:
+        return error("Invalid hours")
+
+    try:
+        return success(get_stats(hours))
+    except redis.RedisError:
+        return error("Profiling stats are unavailable right now", 503)
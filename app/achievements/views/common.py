@@ -1,4 +1,3 @@
-from common.serializer import SerializableField
 from common.validation import *
 
 from django.contrib.auth import login as do_login
@@ -11,10 +10,19 @@ from django.conf import settings
 
 from .util import *
 from .anonymous_names import verify_name
+from ..cache import get_achievements_payload, get_decoded_achievements_payload, get_cached_effective_team_count
+from ..leaderboard import get_leaderboard_position, invalidate_leaderboard
 
+from collections import defaultdict
 from datetime import datetime, timezone
 
 
+# cached achievement payloads are dropped whenever the iteration's version gets bumped,
+# these only bound how stale they can get if something is changed without bumping it
+ACHIEVEMENTS_CACHE_TTL = 10
+ENDED_ACHIEVEMENTS_CACHE_TTL = 60 * 60
+
+
 def serialize_team(team: Team):
     return team.serialize(includes=["players__user"])
 
@@ -97,6 +105,113 @@ def achievement(req, achievement):
     )
 
 
+def serialize_all_achievements(query, with_solutions: bool) -> list[dict]:
+    completion_prefetch = models.Prefetch(
+        "completions", queryset=AchievementCompletion.objects.select_related("player__user", "placement")
+    )
+    beatmaps_prefetch = models.Prefetch("beatmaps", queryset=BeatmapConnection.objects.select_related("info"))
+
+    includes = [
+        "completions__player__user",
+        "completions__placement",
+        "beatmaps__info",
+        "completion_count",
+        "batch",
+    ]
+    excludes = [
+        "completions__player__team_admin",
+        "completions__player__user_id",
+        "completions__player__user__is_admin",
+        "completions__player__user__is_achievement_creator",
+    ]
+
+    if with_solutions:
+        includes.append("solution")
+        includes.append("creator")
+        excludes.append("creator__avatar")
+        excludes.append("creator__is_admin")
+        excludes.append("creator__is_achievement_creator")
+
+    return [
+        achievement.serialize(includes, excludes)
+        for achievement in query.prefetch_related(completion_prefetch, beatmaps_prefetch).all()
+    ]
+
+
+def serialize_shared_achievements(query) -> list[dict]:
+    # the part of the in-progress payload that's the same for every team:
+    # completions are limited to placement rows, which are shown anonymously.
+    # the completion id is kept so a team's own rows can be swapped in later
+    completion_prefetch = models.Prefetch(
+        "completions",
+        queryset=AchievementCompletion.objects.select_related("placement").filter(placement__isnull=False),
+    )
+    beatmaps_prefetch = models.Prefetch(
+        "beatmaps", queryset=BeatmapConnection.objects.select_related("info").filter(hide=False)
+    )
+
+    return [
+        achievement.serialize(
+            ["beatmaps__info", "completions__placement", "completions__id", "batch", "completion_count"],
+            ["completions__time_completed"],
+        )
+        for achievement in query.prefetch_related(completion_prefetch, beatmaps_prefetch).all()
+    ]
+
+
+def serialize_team_completions(team_id: int, iteration_id: int, now: datetime) -> dict[int, dict[int, dict]]:
+    """Returns {achievement id: {completion id: completion}} of the team's released completions"""
+    completions = AchievementCompletion.objects.select_related("player__user", "placement").filter(
+        player__team_id=team_id,
+        achievement__batch__iteration_id=iteration_id,
+        achievement__batch__release_time__lte=now,
+    )
+
+    result = defaultdict(dict)
+    for completion in completions:
+        result[completion.achievement_id][completion.id] = completion.serialize(
+            ["player__user", "placement"],
+            [
+                "player__team_admin",
+                "player__user_id",
+                "player__user__is_admin",
+                "player__user__is_achievement_creator",
+            ],
+        )
+    return result
+
+
+def prepare_shared_achievements(achievements: list[dict]) -> list[tuple[dict, list[int]]]:
+    """Splits the completion ids off of the decoded shared payload, giving [(achievement, completion ids)]"""
+    result = []
+    for achievement in achievements:
+        completion_ids = [completion.pop("id") for completion in achievement["completions"]]
+        result.append((achievement, completion_ids))
+    return result
+
+
+def merge_team_completions(
+    achievements: list[tuple[dict, list[int]]], team_completions: dict[int, dict[int, dict]]
+) -> list[dict]:
+    # the shared achievements are reused between requests, so they're copied instead of modified
+    merged = []
+    for achievement, completion_ids in achievements:
+        own_completions = team_completions.get(achievement["id"])
+        if own_completions is None:
+            merged.append(achievement)
+            continue
+
+        # the team's own placement rows are replaced with the full version
+        completions = [
+            completion
+            for completion, completion_id in zip(achievement["completions"], completion_ids)
+            if completion_id not in own_completions
+        ]
+        merged.append({**achievement, "completions": completions + list(own_completions.values())})
+
+    return merged
+
+
 @require_iteration_after_start
 def achievements(req, iteration):
     if not (iteration_ended := iteration.has_ended()):
@@ -108,79 +223,40 @@ def achievements(req, iteration):
             if registration is None:
                 return error("must be registered", status=403)
 
-    team = (
-        Team.objects.prefetch_related("players").filter(players__user_id=req.user.id, iteration_id=iteration.id).first()
-    )
-
-    # shouldn't be possible, but let's check anyway
-    if not iteration_ended and team is None and not req.user.is_staff:
-        return error("must be on a team", status=403)
-
-    completion_prefetch = models.Prefetch(
-        "completions", queryset=AchievementCompletion.objects.select_related("player__user", "placement")
-    )
-    beatmaps_prefetch = models.Prefetch("beatmaps", queryset=BeatmapConnection.objects.select_related("info"))
-
+    now = datetime.now(tz=timezone.utc)
     query = Achievement.objects.select_related("batch", "creator").filter(
-        batch__iteration_id=iteration.id, batch__release_time__lte=datetime.now(tz=timezone.utc)
+        batch__iteration_id=iteration.id, batch__release_time__lte=now
     )
+    # releasing a batch changes the result without anything being written,
+    # so the number of released batches is part of the cache key
+    released_batches = AchievementBatch.objects.filter(iteration_id=iteration.id, release_time__lte=now).count()
 
     is_staff = req.user.is_authenticated and req.user.is_staff
     if is_staff or iteration_ended:
-        query = query.prefetch_related(completion_prefetch, beatmaps_prefetch)
-        includes = [
-            "completions__player__user",
-            "completions__placement",
-            "beatmaps__info",
-            "completion_count",
-            "batch",
-        ]
-        excludes = [
-            "completions__player__team_admin",
-            "completions__player__user_id",
-            "completions__player__user__is_admin",
-            "completions__player__user__is_achievement_creator",
-        ]
-
-        if iteration.solutions_released or is_staff:
-            includes.append("solution")
-            includes.append("creator")
-            excludes.append("creator__avatar")
-            excludes.append("creator__is_admin")
-            excludes.append("creator__is_achievement_creator")
+        with_solutions = iteration.solutions_released or is_staff
+        payload = get_achievements_payload(
+            iteration.id,
+            f"{released_batches}:{'full' if with_solutions else 'public'}",
+            lambda: serialize_all_achievements(query, with_solutions),
+            ENDED_ACHIEVEMENTS_CACHE_TTL if iteration_ended else ACHIEVEMENTS_CACHE_TTL,
+        )
+        return success_encoded(payload)
 
-        return success([achievement.serialize(includes, excludes) for achievement in query.all()])
+    team = Team.objects.filter(players__user_id=req.user.id, iteration_id=iteration.id).first()
 
-    def team_completion(c: AchievementCompletion) -> bool:
-        return any((player.id == c.player_id for player in team.players.all())) if team is not None else False
+    # shouldn't be possible, but let's check anyway
+    if team is None:
+        return error("must be on a team", status=403)
 
-    completion_prefetch.queryset = completion_prefetch.queryset.filter(
-        models.Q(player__team_id=team.id) | models.Q(placement__isnull=False)
+    shared = get_decoded_achievements_payload(
+        iteration.id,
+        f"{released_batches}:shared",
+        lambda: serialize_shared_achievements(query),
+        ACHIEVEMENTS_CACHE_TTL,
+        prepare_shared_achievements,
     )
-    beatmaps_prefetch.queryset = beatmaps_prefetch.queryset.filter(hide=False)
-
-    result = [
-        achievement.serialize(
-            [
-                "beatmaps__info",
-                SerializableField("completions__player", condition=team_completion),
-                SerializableField("completions__time_completed", condition=team_completion),
-                "completions__player__user",
-                "completions__placement",
-                "batch",
-                "completion_count",
-            ],
-            [
-                "completions__player__team_admin",
-                "completions__player__user_id",
-                "completions__player__user__is_admin",
-                "completions__player__user__is_achievement_creator",
-            ],
-        )
-        for achievement in query.prefetch_related(completion_prefetch, beatmaps_prefetch).all()
-    ]
-
-    return success(result)
+    team_completions = serialize_team_completions(team.id, iteration.id, now)
+    return success(merge_team_completions(shared, team_completions))
 
 
 @require_iteration
@@ -213,7 +289,7 @@ def achievement_completions(req, iteration):
     )
 
 
-def get_effective_team_count(iteration_id):
+def count_effective_teams(iteration_id):
     return (
         AchievementCompletion.objects.select_related("player", "achievement__batch")
         .filter(achievement__batch__iteration_id=iteration_id)
@@ -223,37 +299,37 @@ def get_effective_team_count(iteration_id):
     )
 
 
+def get_effective_team_count(iteration_id):
+    return get_cached_effective_team_count(iteration_id, lambda: count_effective_teams(iteration_id))
+
+
 @require_iteration
 def teams(req, iteration):
-    all_teams = select_teams(iteration.id, many=True, sort=True)
     if iteration.has_ended() or (req.user.is_authenticated and req.user.is_staff):
         my_team_i = -1
-        serialized_teams = list(map(serialize_team, all_teams))
+        serialized_teams = list(map(serialize_team, select_teams(iteration.id, many=True, sort=True)))
     else:
-        my_team_item = next(
-            (
-                (i, team)
-                for i, team in enumerate(all_teams)
-                if any((player.user_id == req.user.id for player in team.players.all()))
-            ),
-            None,
-        )
+        position = get_leaderboard_position(iteration.id, req.user.id) if req.user.is_authenticated else None
+        my_team_i, my_team_id, team_ids = position if position is not None else (-1, None, [])
+        teams_by_id = {team.id: team for team in select_teams(iteration.id, many=True, id__in=team_ids)}
 
-        if my_team_item is None:
+        if my_team_id not in teams_by_id:
             return success(
                 {"placement": 0, "teams": [], "effective_team_count": get_effective_team_count(iteration.id)}
             )
 
-        my_team_i, my_team = my_team_item
-
         # localized leaderboard
         # (teams above and below you)
-        serialized_teams = [serialize_team(my_team)]
         excludes = ["name", "accepts_free_agents", "free_agent_type"]
-        if my_team_i > 0:
-            serialized_teams.insert(0, all_teams[my_team_i - 1].serialize(excludes=excludes))
-        if my_team_i < len(all_teams) - 1:
-            serialized_teams.append(all_teams[my_team_i + 1].serialize(excludes=excludes))
+        serialized_teams = [
+            (
+                serialize_team(teams_by_id[team_id])
+                if team_id == my_team_id
+                else teams_by_id[team_id].serialize(excludes=excludes)
+            )
+            for team_id in team_ids
+            if team_id in teams_by_id
+        ]
 
     return success(
         {
@@ -287,6 +363,7 @@ def leave_team(req, iteration, registration):
     except RestrictedError:
         return error("cannot leave a team after completing an achievement")
 
+    invalidate_leaderboard(iteration.id)
     return success({"team_id": team_id, "user_id": req.user.id})
 
 
@@ -316,6 +393,7 @@ def create_team(req, data, iteration, registration):
 
     player = Player(user=req.user, team_id=team.id, team_admin=True)
     player.save()
+    invalidate_leaderboard(iteration.id)
 
     team = team.serialize()
     player = player.serialize(includes=["user"])
@@ -520,6 +598,7 @@ def resolve_invite(req, invite_id, data):
 
     Player.objects.create(user_id=req.user.id, team_id=team.id)
     invite.delete()
+    invalidate_leaderboard(team.iteration_id)
     return success(team.serialize())
 
 
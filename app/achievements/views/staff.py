@@ -1,10 +1,12 @@
 from django.views.decorators.http import require_POST, require_GET, require_http_methods
 from django.conf import settings
+from django.db import transaction
 
 from .util import *
 from common.serializer import SerializableField
 from common.validation import *
 from common import comm
+from ..cache import bump_achievements_version
 
 from playtest.models import PlaytestAccount
 
@@ -16,6 +18,10 @@ __all__ = ("achievements",)
 
 discord_logger = settings.DISCORD_LOGGER
 COMMENT_CHANNELS = ["General", "Solving"]
+# defined once so serialization plans using it can be reused between calls
+USER_RATING_FIELD = SerializableField(
+    "user_rating", post_transform=lambda ratings: None if len(ratings) == 0 else ratings[0].serialize()
+)
 
 
 def serialize_full_achievement(achievement: Achievement):
@@ -32,13 +38,15 @@ def serialize_full_achievement(achievement: Achievement):
             "upvotes",
             "avg_difficulty_rating",
             "avg_quality_rating",
-            SerializableField(
-                "user_rating", post_transform=lambda ratings: None if len(ratings) == 0 else ratings[0].serialize()
-            ),
+            USER_RATING_FIELD,
         ]
     )
 
 
+def get_achievement_iteration_id(achievement: Achievement) -> int | None:
+    return None if achievement.batch is None else achievement.batch.iteration_id
+
+
 def with_user_rating(user_id, query):
     return query.prefetch_related(
         models.Prefetch("ratings", queryset=AchievementRating.objects.filter(user_id=user_id), to_attr="user_rating")
@@ -141,7 +149,7 @@ def delete_comment(req, comment_id):
 
 @require_staff
 @require_POST
-@require_achievement()
+@require_achievement(select=["batch"])
 @accepts_json_data(
     DictionaryType(
         {
@@ -155,32 +163,35 @@ def set_achievement_rating(req, data, achievement):
     if req.user.id == achievement.creator_id:
         return error("Can't rate your own achievement!")
 
-    rating = AchievementRating.objects.filter(achievement_id=achievement.id, user_id=req.user.id).first()
-    if rating is None:
-        rating = AchievementRating.objects.create(
-            achievement_id=achievement.id,
-            user_id=req.user.id,
-            upvoted=data["upvoted"],
-            quality=data.get("quality"),
-            difficulty=data.get("difficulty"),
-        )
-    else:
-        rating.upvoted = data["upvoted"]
-        rating.quality = data.get("quality")
-        rating.difficulty = data.get("difficulty")
-        rating.save()
-
-    # update achievement attributes
-    result = AchievementRating.objects.aggregate(
-        avg=models.Avg("quality", filter=models.Q(achievement_id=achievement.id))
-    )
-    achievement.avg_quality_rating = None if result is None else result["avg"]
-    result = AchievementRating.objects.aggregate(
-        avg=models.Avg("difficulty", filter=models.Q(achievement_id=achievement.id))
+    rating = AchievementRating(
+        achievement_id=achievement.id,
+        user_id=req.user.id,
+        upvoted=data["upvoted"],
+        quality=data.get("quality"),
+        difficulty=data.get("difficulty"),
     )
-    achievement.avg_difficulty_rating = None if result is None else result["avg"]
-    achievement.upvotes = AchievementRating.objects.filter(achievement_id=achievement.id, upvoted=True).count()
-    achievement.save()
+    with transaction.atomic():
+        # ratings of the same achievement are applied one at a time, so the averages include all of them
+        Achievement.objects.select_for_update().filter(id=achievement.id).values_list("id").first()
+        AchievementRating.objects.bulk_create(
+            [rating],
+            update_conflicts=True,
+            unique_fields=["achievement", "user"],
+            update_fields=["upvoted", "quality", "difficulty"],
+        )
+
+        # update achievement attributes
+        result = AchievementRating.objects.filter(achievement_id=achievement.id).aggregate(
+            avg_quality=models.Avg("quality"),
+            avg_difficulty=models.Avg("difficulty"),
+            upvotes=models.Count("id", filter=models.Q(upvoted=True)),
+        )
+        achievement.avg_quality_rating = result["avg_quality"]
+        achievement.avg_difficulty_rating = result["avg_difficulty"]
+        achievement.upvotes = result["upvotes"]
+        achievement.save(update_fields=["avg_quality_rating", "avg_difficulty_rating", "upvotes"])
+
+    bump_achievements_version(get_achievement_iteration_id(achievement))
 
     return success(
         {
@@ -205,7 +216,7 @@ def set_achievement_rating(req, data, achievement):
             "beatmaps": ListType(
                 DictionaryType({"id": IntegerType(), "hide": BoolType()}),
                 unique=True,
-                unique_check=lambda a, b: a["id"] != b["id"],
+                unique_key=lambda beatmap: beatmap["id"],
             ),
             "solution_algorithm": AnyType(),
             "algorithm_enabled": BoolType(),
@@ -213,32 +224,16 @@ def set_achievement_rating(req, data, achievement):
     )
 )
 def create_achievement(req, data, achievement=None):
-    beatmaps = data["beatmaps"]
-    if len(beatmaps) > 0:
-        beatmap_objs = BeatmapInfo.bulk_get_or_create([beatmap["id"] for beatmap in beatmaps])
-        if beatmap_objs is None:
+    beatmap_data = []
+    if len(data["beatmaps"]) > 0:
+        # fetched before the transaction, so it isn't kept open during api requests
+        beatmap_data = BeatmapInfo.fetch_data([beatmap["id"] for beatmap in data["beatmaps"]])
+        if beatmap_data is None:
             return error("invalid beatmap id")
 
-        beatmaps = [
-            (beatmap, next((item["hide"] for item in beatmaps if item["id"] == beatmap.id))) for beatmap in beatmap_objs
-        ]
-
-    if achievement is None:
-        achievement = Achievement.objects.create(
-            name=data["name"],
-            description=data["description"],
-            solution=data["solution"],
-            tags=data["tags"],
-            creator=req.user,
-            created_at=(date_now := datetime.now(tz=timezone.utc)),
-            last_edited_at=date_now,
-            solution_algorithm=data["solution_algorithm"],
-            algorithm_enabled=data["algorithm_enabled"],
-        )
-        discord_logger.submit_achievement(req, achievement, "created")
-    elif achievement.creator_id != req.user.id and not req.user.is_admin:
-        return error("cannot edit an achievement that's not yours")
-    else:
+    if achievement is not None:
+        if achievement.creator_id != req.user.id and not req.user.is_admin:
+            return error("cannot edit an achievement that's not yours")
         if achievement.batch_id is not None and not data.get("change_note"):
             return error("change note is required for batched achievements")
         if (
@@ -248,28 +243,46 @@ def create_achievement(req, data, achievement=None):
         ):
             return error("only admins can edit achievements after release")
 
-        achievement.name = data["name"]
-        achievement.description = data["description"]
-        achievement.solution = data["solution"]
-        achievement.tags = data["tags"]
-        achievement.last_edited_at = datetime.now(tz=timezone.utc)
-        achievement.solution_algorithm = data["solution_algorithm"]
-        achievement.algorithm_enabled = data["algorithm_enabled"]
-        achievement.save()
-
+    # the beatmaps, the achievement and its connections are written together
+    with transaction.atomic():
+        hidden = {beatmap["id"]: beatmap["hide"] for beatmap in data["beatmaps"]}
+        beatmaps = [(beatmap, hidden[beatmap.id]) for beatmap in BeatmapInfo.bulk_upsert(beatmap_data)]
+
+        is_new = achievement is None
+        if is_new:
+            achievement = Achievement.objects.create(
+                name=data["name"],
+                description=data["description"],
+                solution=data["solution"],
+                tags=data["tags"],
+                creator=req.user,
+                created_at=(date_now := datetime.now(tz=timezone.utc)),
+                last_edited_at=date_now,
+                solution_algorithm=data["solution_algorithm"],
+                algorithm_enabled=data["algorithm_enabled"],
+            )
+        else:
+            achievement.name = data["name"]
+            achievement.description = data["description"]
+            achievement.solution = data["solution"]
+            achievement.tags = data["tags"]
+            achievement.last_edited_at = datetime.now(tz=timezone.utc)
+            achievement.solution_algorithm = data["solution_algorithm"]
+            achievement.algorithm_enabled = data["algorithm_enabled"]
+            achievement.save()
+
+        connections = BeatmapConnection.bulk_set(achievement.id, beatmaps)
+
+    if is_new:
+        discord_logger.submit_achievement(req, achievement, "created")
+    else:
         discord_logger.submit_achievement(req, achievement, "edited", data.get("change_note"))
 
     comm.refresh_achievements_on_server()
 
-    resp_beatmaps = []
+    resp_beatmaps = [connection.serialize(includes=["info"]) for connection in connections]
 
-    for connection in BeatmapConnection.objects.filter(achievement_id=achievement.id):
-        if not any((info.id == connection.info_id for info, _ in beatmaps)):
-            connection.delete()
-
-    for info, hide in beatmaps:
-        obj, _ = BeatmapConnection.objects.update_or_create(achievement=achievement, info=info, defaults={"hide": hide})
-        resp_beatmaps.append(obj.serialize(includes=["info"]))
+    bump_achievements_version(get_achievement_iteration_id(achievement))
 
     resp_data = achievement.serialize(
         includes=["creator", "solution", "batch", "solution_algorithm", "algorithm_enabled"]
@@ -286,13 +299,14 @@ def edit_achievement(req, achievement):
 
 @require_staff
 @require_http_methods(["DELETE"])
-@require_achievement()
+@require_achievement(select=["batch"])
 def delete_achievement(req, achievement):
     if achievement.creator_id != req.user.id and not req.user.is_admin:
         return error("cannot delete an achievement that's not yours")
 
     achievement.delete()
     comm.refresh_achievements_on_server()
+    bump_achievements_version(get_achievement_iteration_id(achievement))
     discord_logger.submit_achievement(req, achievement, "deleted")
     return success(None)
 
@@ -342,8 +356,10 @@ def request_algorithm_docs(req):
 
 @require_POST
 @require_staff
-@require_achievement()
+@require_achievement(select=["batch"])
 @accepts_json_data(DictionaryType({"guess": StringType()}))
 def submit_password_guess(req, achievement, data):
     completions = comm.submit_pw_guess(req.user.id, achievement.id, data["guess"])
+    if len(completions) > 0:
+        bump_achievements_version(get_achievement_iteration_id(achievement))
     return success({"correct": len(completions) > 0})
@@ -1,7 +1,12 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from ..models import *
 
 
@@ -30,9 +35,22 @@ def success(data, status=200):
     return JsonResponse({"data": data}, status=status, safe=False)
 
 
+def success_encoded(data: bytes, status=200):
+    """Same as success, but for data that's already json encoded"""
+    return HttpResponse(b'{"data": ' + data + b"}", status=status, content_type="application/json")
+
+
+def loads_body(body: bytes):
+    """Raises ValueError for invalid json or utf-8"""
+    if orjson is not None:
+        return orjson.loads(body)
+
+    return json.loads(body.decode("utf-8"))
+
+
 def parse_body(body: bytes, require_has: tuple | list):
     try:
-        data = json.loads(body.decode("utf-8"))
+        data = loads_body(body)
         if not isinstance(data, dict):
             return
 
@@ -41,22 +59,24 @@ def parse_body(body: bytes, require_has: tuple | list):
                 return
 
         return data
-    except (UnicodeDecodeError, json.JSONDecodeError):
+    except ValueError:
         return
 
 
 def accepts_json_data(fmt):
+    validate = fmt.compile()
+
     def decorator(func):
         def check(req, *args, **kwargs):
             try:
-                data = json.loads(req.body.decode("utf-8"))
-                result = fmt.validate(data)
-                if result.is_failed:
-                    return error(result.msg, 400)
-                return func(req, *args, data=data, **kwargs)
-            except json.JSONDecodeError:
+                data = loads_body(req.body)
+            except ValueError:
                 return error("Invalid json data", 400)
 
+            if (msg := validate(data)) is not None:
+                return error(msg.replace("{name}", "data"), 400)
+            return func(req, *args, data=data, **kwargs)
+
         return check
 
     return decorator
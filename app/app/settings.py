@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "middleware.RequestProfilingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -173,3 +174,8 @@ WS_CONNECTION_VALIDATOR = os.getenv("WS_CONNECTION_VALIDATOR")
 DISCORD_LOGGER = DiscordLogger()
 
 COMM_PORT = int(os.getenv("COMM_PORT"))
+# negotiate a compact encoding/delta frames with the score server on each connection
+COMM_NEGOTIATE = bool(int(os.getenv("COMM_NEGOTIATE", "0")))
+
+# fraction of requests that RequestProfilingMiddleware records stats for (0 to disable)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
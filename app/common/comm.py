@@ -1,24 +1,379 @@
 from django.conf import settings
 
+import asyncio
 import socket
 import json
+import os
 import struct
+import threading
+from collections import defaultdict
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-def _send(data, close=True):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(("localhost", settings.COMM_PORT))
+
+# seconds to wait on the score server before giving up on a request
+COMM_TIMEOUT = 10
+# max idle connections kept around per process
+COMM_POOL_SIZE = 8
+
+HEADER = struct.Struct(">I")
+
+# first frame of a connection when COMM_NEGOTIATE is on. it's always json, and
+# the server answers (in json) with the encoding to use for the rest of the
+# connection and whether it accepts delta frames
+EVT_HELLO = 0
+EVT_SUBMIT_SCORES = 1
+
+ENCODINGS = {
+    "json": (lambda data: json.dumps(data).encode("utf-8"), lambda payload: json.loads(payload.decode("utf-8"))),
+}
+if msgpack is not None:
+    ENCODINGS = {"msgpack": (msgpack.packb, msgpack.unpackb), **ENCODINGS}
+
+# connections are closed after sending this many scores in delta
+# mode, so neither side has to remember them forever
+DELTA_MAX_SCORES = 5000
+
+
+def _encode_frame(data) -> bytes:
     payload = json.dumps(data).encode("utf-8")
-    sock.sendall(struct.pack(">I", len(payload)) + payload)
-    if close:
+    return HEADER.pack(len(payload)) + payload
+
+
+class Protocol:
+    """
+    How frames are encoded on one connection.
+
+    In delta mode, score submissions only include scores that haven't been sent on the connection
+    yet, plus the checksums of every score in order. Beatmaps already sent on the connection are
+    left out of scores, and the server fills them back in from the score's beatmap_id.
+
+    Without a hello, the server reads one frame per connection and closes it, so only
+    negotiated connections are kept alive and reused.
+    """
+
+    __slots__ = ("encoding", "delta", "keep_alive", "_dumps", "_loads", "_beatmaps_sent", "_scores_sent", "_n_scores")
+
+    def __init__(self, encoding: str = "json", delta: bool = False, keep_alive: bool = False):
+        self.encoding: str = encoding
+        self.delta: bool = delta
+        self.keep_alive: bool = keep_alive
+        self._dumps, self._loads = ENCODINGS[encoding]
+        self._beatmaps_sent: set[int] = set()
+        # user id -> checksums
+        self._scores_sent: dict[int, set[str]] = defaultdict(set)
+        self._n_scores: int = 0
+
+    @staticmethod
+    def hello_frame() -> bytes:
+        return _encode_frame({"evt": EVT_HELLO, "encodings": list(ENCODINGS.keys()), "delta": True})
+
+    @classmethod
+    def from_hello_reply(cls, reply: dict) -> "Protocol":
+        encoding = reply.get("encoding")
+        return cls(encoding if encoding in ENCODINGS else "json", bool(reply.get("delta")), keep_alive=True)
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self._n_scores >= DELTA_MAX_SCORES
+
+    def _compact_scores(self, data: dict) -> dict:
+        sent = self._scores_sent[data["user"]["id"]]
+        scores = []
+        for score in data["scores"]:
+            if score["checksum"] in sent:
+                continue
+
+            sent.add(score["checksum"])
+            self._n_scores += 1
+            if score["beatmap_id"] in self._beatmaps_sent:
+                score = {key: value for key, value in score.items() if key not in ("beatmap", "beatmapset")}
+            else:
+                self._beatmaps_sent.add(score["beatmap_id"])
+            scores.append(score)
+
+        return {**data, "scores": scores, "checksums": [score["checksum"] for score in data["scores"]], "delta": True}
+
+    def encode(self, data) -> bytes:
+        if self.delta and data.get("evt") == EVT_SUBMIT_SCORES:
+            data = self._compact_scores(data)
+
+        payload = self._dumps(data)
+        return HEADER.pack(len(payload)) + payload
+
+    def decode(self, payload: bytes):
+        return self._loads(payload)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("score server closed the connection")
+        received += n
+
+    return bytes(buf)
+
+
+def _is_reusable(sock: socket.socket) -> bool:
+    # an idle connection should have nothing to read; either the
+    # server closed it or there's a leftover reply we can't match up
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return True
+    except OSError:
+        pass
+    finally:
+        sock.settimeout(timeout)
+
+    return False
+
+
+class ConnectionPool:
+    """
+    Keeps connections to the score server open between requests, when the server
+    agreed to keep them alive. Each connection carries one request at a time, and is
+    thrown away on any error, so a late reply can never be read by the wrong request.
+    """
+
+    __slots__ = ("address", "size", "timeout", "negotiate", "_idle", "_lock", "_pid")
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        size: int = COMM_POOL_SIZE,
+        timeout: float = COMM_TIMEOUT,
+        negotiate: bool = False,
+    ):
+        self.address: tuple[str, int] = address
+        self.size: int = size
+        self.timeout: float = timeout
+        self.negotiate: bool = negotiate
+        self._idle: list[tuple[socket.socket, Protocol]] = []
+        self._lock: threading.Lock = threading.Lock()
+        self._pid: int = os.getpid()
+
+    def _connect(self) -> tuple[socket.socket, Protocol]:
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        if not self.negotiate:
+            return sock, Protocol()
+
+        try:
+            sock.sendall(Protocol.hello_frame())
+            (payload_len,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+            reply = json.loads(_recv_exactly(sock, payload_len).decode("utf-8"))
+        except BaseException:
+            sock.close()
+            raise
+
+        return sock, Protocol.from_hello_reply(reply)
+
+    def _acquire(self) -> tuple[socket.socket, Protocol, bool]:
+        with self._lock:
+            # sockets shouldn't be shared with forked workers
+            if self._pid != os.getpid():
+                for sock, _ in self._idle:
+                    sock.close()
+                self._idle.clear()
+                self._pid = os.getpid()
+
+            while len(self._idle) > 0:
+                sock, protocol = self._idle.pop()
+                if _is_reusable(sock):
+                    return sock, protocol, True
+                sock.close()
+
+        return *self._connect(), False
+
+    def _release(self, sock: socket.socket, protocol: Protocol):
+        if not protocol.keep_alive:
+            sock.close()
+            return
+
+        with self._lock:
+            if len(self._idle) < self.size and not protocol.is_exhausted:
+                self._idle.append((sock, protocol))
+                return
+
         sock.close()
-    return sock
+
+    def request(self, data, recv: bool = True):
+        sock, protocol, reused = self._acquire()
+        try:
+            try:
+                sock.sendall(protocol.encode(data))
+            except ConnectionError:
+                if not reused:
+                    raise
+                # the server dropped the idle connection, so it never got the request. once
+                # it's been sent it's never retried, since the server may have handled it
+                sock.close()
+                sock, protocol = self._connect()
+                sock.sendall(protocol.encode(data))
+
+            reply = None
+            if recv:
+                (payload_len,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+                reply = protocol.decode(_recv_exactly(sock, payload_len))
+        except BaseException:
+            sock.close()
+            raise
+
+        self._release(sock, protocol)
+        return reply
+
+
+class AsyncConnectionPool:
+    """
+    asyncio version of ConnectionPool, for use from async views.
+    Streams belong to the loop they were opened in, and under WSGI each async request runs
+    its own loop in its own thread, so idle connections are kept per loop.
+    """
+
+    __slots__ = ("address", "size", "timeout", "negotiate", "_idle", "_lock")
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        size: int = COMM_POOL_SIZE,
+        timeout: float = COMM_TIMEOUT,
+        negotiate: bool = False,
+    ):
+        self.address: tuple[str, int] = address
+        self.size: int = size
+        self.timeout: float = timeout
+        self.negotiate: bool = negotiate
+        # the streams reference their loop, so entries of closed loops have to be removed by hand
+        self._idle: dict[
+            asyncio.AbstractEventLoop, list[tuple[asyncio.StreamReader, asyncio.StreamWriter, Protocol]]
+        ] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    async def _read_frame(self, reader: asyncio.StreamReader) -> bytes:
+        header = await asyncio.wait_for(reader.readexactly(HEADER.size), self.timeout)
+        (payload_len,) = HEADER.unpack(header)
+        return await asyncio.wait_for(reader.readexactly(payload_len), self.timeout)
+
+    async def _write_frame(self, writer: asyncio.StreamWriter, frame: bytes):
+        writer.write(frame)
+        await asyncio.wait_for(writer.drain(), self.timeout)
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, Protocol]:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*self.address), self.timeout)
+        if not self.negotiate:
+            return reader, writer, Protocol()
+
+        try:
+            await self._write_frame(writer, Protocol.hello_frame())
+            reply = json.loads((await self._read_frame(reader)).decode("utf-8"))
+        except BaseException:
+            writer.close()
+            raise
+
+        return reader, writer, Protocol.from_hello_reply(reply)
+
+    def _prune_closed_loops(self):
+        # must be called with _lock held
+        for loop in [loop for loop in self._idle if loop.is_closed()]:
+            for _, writer, _ in self._idle.pop(loop):
+                # a closed loop can't run the transport's close, so just end the connection.
+                # nothing polls the socket anymore, and it's closed when the transport is collected
+                if (sock := writer.get_extra_info("socket")) is not None:
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+    async def _acquire(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, Protocol, bool]:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                self._prune_closed_loops()
+                if len(idle := self._idle.get(loop, ())) == 0:
+                    break
+                reader, writer, protocol = idle.pop()
+
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, protocol, True
+            writer.close()
+
+        return *(await self._connect()), False
+
+    def _release(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, protocol: Protocol):
+        if protocol.keep_alive and not protocol.is_exhausted:
+            with self._lock:
+                idle = self._idle.setdefault(asyncio.get_running_loop(), [])
+                if len(idle) < self.size:
+                    idle.append((reader, writer, protocol))
+                    return
+
+        writer.close()
+
+    async def request(self, data, recv: bool = True):
+        reader, writer, protocol, reused = await self._acquire()
+        try:
+            try:
+                await self._write_frame(writer, protocol.encode(data))
+            except ConnectionError:
+                if not reused:
+                    raise
+                # same as ConnectionPool.request, only retried if the request wasn't sent
+                writer.close()
+                reader, writer, protocol = await self._connect()
+                await self._write_frame(writer, protocol.encode(data))
+
+            reply = None
+            if recv:
+                reply = protocol.decode(await self._read_frame(reader))
+        except BaseException:
+            writer.close()
+            raise
+
+        self._release(reader, writer, protocol)
+        return reply
+
+
+_pool: ConnectionPool | None = None
+_async_pool: AsyncConnectionPool | None = None
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+
+    if _pool is None:
+        _pool = ConnectionPool(("localhost", settings.COMM_PORT), negotiate=settings.COMM_NEGOTIATE)
+
+    return _pool
+
+
+def get_async_pool() -> AsyncConnectionPool:
+    global _async_pool
+
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(("localhost", settings.COMM_PORT), negotiate=settings.COMM_NEGOTIATE)
+
+    return _async_pool
+
+
+def _send(data):
+    get_pool().request(data, recv=False)
 
 
 def _send_and_recv(data):
-    sock = _send(data, close=False)
-    (payload_len,) = struct.unpack(">I", sock.recv(4))
-    return json.loads(sock.recv(payload_len).decode("utf-8"))
+    return get_pool().request(data)
+
+
+async def _asend_and_recv(data):
+    return await get_async_pool().request(data)
 
 
 def refresh_achievements_on_server():
@@ -26,7 +381,11 @@ def refresh_achievements_on_server():
 
 
 def submit_playtest_scores(user, scores):
-    return _send_and_recv({"evt": 1, "user": user, "scores": scores})
+    return _send_and_recv({"evt": EVT_SUBMIT_SCORES, "user": user, "scores": scores})
+
+
+async def asubmit_playtest_scores(user, scores):
+    return await _asend_and_recv({"evt": EVT_SUBMIT_SCORES, "user": user, "scores": scores})
 
 
 def submit_pw_guess(user_id: int, achievement_id: int, guess: str):
@@ -1,8 +1,9 @@
 import os
 import threading
 import requests
-import queue
 import logging
+import time
+from collections import deque
 from datetime import datetime, timezone
 
 from django.conf import settings
@@ -14,12 +15,23 @@ __all__ = ("DiscordLogger",)
 _log = logging.getLogger(__name__)
 
 
+# discord's limits for a single message
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARS_PER_MESSAGE = 6000
+EMBED_TITLE_LIMIT = 256
+EMBED_DESCRIPTION_LIMIT = 4096
+# embeds waiting to be sent per webhook, past which new ones are dropped
+MAX_QUEUED_EMBEDS = 200
+# used when a 429 doesn't say how long to wait, and after network errors
+DEFAULT_RETRY_AFTER = 5.0
+
+
 def _create_error_embeds(req, exc):
     embeds = []
     embeds.append(
         {
             "title": f"{req.method} {req.path}",
-            "description": str(exc),
+            "description": str(exc)[:EMBED_DESCRIPTION_LIMIT],
             "color": 0xFF0000,
         }
     )
@@ -35,47 +47,189 @@ def _create_author_info(user):
     }
 
 
+def _embed_chars(embed) -> int:
+    # what discord counts towards EMBED_CHARS_PER_MESSAGE
+    return (
+        len(embed.get("title", ""))
+        + len(embed.get("description", ""))
+        + len(embed.get("footer", {}).get("text", ""))
+        + len(embed.get("author", {}).get("name", ""))
+        + sum(len(field["name"]) + len(field["value"]) for field in embed.get("fields", ()))
+    )
+
+
+def _header_seconds(resp, name) -> float | None:
+    try:
+        return float(resp.headers[name])
+    except (KeyError, ValueError):
+        return
+
+
+def _retry_after_from_body(resp) -> float | None:
+    try:
+        return float(resp.json()["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return
+
+
+class _Webhook:
+    __slots__ = ("url", "pending", "dropped", "next_send")
+
+    def __init__(self, url: str):
+        self.url: str = url
+        # (embed, ping) pairs
+        self.pending: deque = deque()
+        self.dropped: int = 0
+        # time.monotonic() before which nothing should be sent
+        self.next_send: float = 0.0
+
+    def take_message(self) -> tuple[list, int | None, int]:
+        """Takes as many pending embeds as fit in one message, as long as they share the same ping"""
+        _, ping = self.pending[0]
+        embeds = []
+        chars = 0
+        while len(self.pending) > 0 and len(embeds) < EMBEDS_PER_MESSAGE:
+            embed, embed_ping = self.pending[0]
+            embed_chars = _embed_chars(embed)
+            if embed_ping != ping or (len(embeds) > 0 and chars + embed_chars > EMBED_CHARS_PER_MESSAGE):
+                break
+
+            self.pending.popleft()
+            embeds.append(embed)
+            chars += embed_chars
+
+        dropped, self.dropped = self.dropped, 0
+        return embeds, ping, dropped
+
+    def put_back(self, embeds: list, ping: int | None, dropped: int):
+        self.pending.extendleft((embed, ping) for embed in reversed(embeds))
+        self.dropped += dropped
+
+
 class DiscordLogger:
+    """
+    Sends embeds to discord webhooks from a background thread, one per process.
+    Embeds queued for the same webhook are combined into as few messages as possible,
+    and each webhook's rate limit is waited out instead of losing messages to 429s.
+    """
+
     ERROR_WEBHOOK_URL = os.getenv("ERROR_WEBHOOK_URL")
     STAFF_WEBHOOK_URL = os.getenv("STAFF_WEBHOOK_URL")
     ANNOUNCEMENT_WEBHOOK_URL = os.getenv("ANNOUNCEMENT_WEBHOOK_URL")
 
     def __init__(self):
-        self._queue: queue.Queue = queue.Queue()
-        self._running: threading.Event = threading.Event()
-
-    def run(self):
-        self._running.set()
-        t = threading.Thread(target=self._loop)
-        t.daemon = True
-        t.start()
+        self._cond: threading.Condition = threading.Condition()
+        self._webhooks: dict[str, _Webhook] = {}
+        self._worker: threading.Thread | None = None
+        self._stopped: bool = False
+        self._pid: int = os.getpid()
+
+    def _ensure_worker(self):
+        # must be called with self._cond held
+        if self._pid != os.getpid():
+            # threads don't survive forking
+            self._worker = None
+            self._pid = os.getpid()
+
+        if self._worker is None or not self._worker.is_alive():
+            self._stopped = False
+            self._worker = threading.Thread(target=self._loop, daemon=True)
+            self._worker.start()
+
+    def _next_webhook(self) -> tuple[_Webhook | None, float | None]:
+        """The webhook to send to now, otherwise how long until one can be sent to (None if nothing is pending)"""
+        now = time.monotonic()
+        wait = None
+        for webhook in self._webhooks.values():
+            if len(webhook.pending) == 0:
+                continue
+            if webhook.next_send <= now:
+                # move it to the back so a busy webhook can't keep the others waiting
+                del self._webhooks[webhook.url]
+                self._webhooks[webhook.url] = webhook
+                return webhook, None
+            wait = webhook.next_send - now if wait is None else min(wait, webhook.next_send - now)
+
+        return None, wait
 
     def _loop(self):
-        while self._running.is_set():
-            try:
-                embeds, url, ping = self._queue.get(timeout=3)
-
-                payload = {"embeds": embeds}
-                if ping is not None:
-                    payload["content"] = f"<@&{ping}>"
-
-                resp = requests.post(url, json=payload)
-                resp.raise_for_status()
-            except queue.Empty:
-                pass
-            except Exception as exc:
-                _log.exception("Failed to send completion to discord", exc_info=exc)
+        session = requests.Session()
+        while True:
+            with self._cond:
+                webhook, wait = self._next_webhook()
+                while webhook is None and not self._stopped:
+                    self._cond.wait(wait)
+                    webhook, wait = self._next_webhook()
+
+                if self._stopped:
+                    return
+
+                embeds, ping, dropped = webhook.take_message()
+
+            self._send(session, webhook, embeds, ping, dropped)
+
+    def _send(self, session: requests.Session, webhook: _Webhook, embeds: list, ping: int | None, dropped: int):
+        content = []
+        if ping is not None:
+            content.append(f"<@&{ping}>")
+        if dropped > 0:
+            content.append(f"({dropped} embeds were dropped)")
+
+        payload = {"embeds": embeds}
+        if len(content) > 0:
+            payload["content"] = " ".join(content)
+
+        try:
+            resp = session.post(webhook.url, json=payload, timeout=10)
+        except requests.RequestException as exc:
+            _log.warning("Failed to send embeds to discord, retrying later", exc_info=exc)
+            with self._cond:
+                webhook.next_send = max(webhook.next_send, time.monotonic() + DEFAULT_RETRY_AFTER)
+                webhook.put_back(embeds, ping, dropped)
+            return
+        except Exception as exc:
+            _log.exception("Failed to send embeds to discord", exc_info=exc)
+            # mentioned in the next message instead of vanishing
+            with self._cond:
+                webhook.dropped += dropped + len(embeds)
+            return
 
-        self._running.clear()
+        with self._cond:
+            if resp.status_code == 429:
+                retry_after = (
+                    _header_seconds(resp, "Retry-After") or _retry_after_from_body(resp) or DEFAULT_RETRY_AFTER
+                )
+                # a global rate limit applies to every webhook
+                limited = self._webhooks.values() if resp.headers.get("X-RateLimit-Global") else (webhook,)
+                for limited_webhook in limited:
+                    limited_webhook.next_send = max(limited_webhook.next_send, time.monotonic() + retry_after)
+                webhook.put_back(embeds, ping, dropped)
+                return
+
+            if _header_seconds(resp, "X-RateLimit-Remaining") == 0:
+                reset_after = _header_seconds(resp, "X-RateLimit-Reset-After")
+                if reset_after is not None:
+                    webhook.next_send = time.monotonic() + reset_after
+
+        if not resp.ok:
+            _log.error(f"Failed to send embeds to discord ({resp.status_code}): {resp.text[:500]}")
 
     def submit_embeds(self, embeds, url, ping=None):
         if settings.DEBUG:
             return
 
-        self._queue.put((embeds, url, ping))
+        with self._cond:
+            if (webhook := self._webhooks.get(url)) is None:
+                webhook = self._webhooks[url] = _Webhook(url)
 
-        if not self._running.is_set():
-            self.run()
+            for embed in embeds:
+                if len(webhook.pending) >= MAX_QUEUED_EMBEDS:
+                    webhook.dropped += 1
+                    continue
+                webhook.pending.append((embed, ping))
+
+            self._ensure_worker()
+            self._cond.notify()
 
     def submit_err(self, req, exc):
         if self.ERROR_WEBHOOK_URL is None:
@@ -84,6 +238,28 @@ class DiscordLogger:
 
         self.submit_embeds(_create_error_embeds(req, exc), self.ERROR_WEBHOOK_URL)
 
+    def submit_err_summary(self, route, message, raised_at, count, window, p50, p95):
+        if self.ERROR_WEBHOOK_URL is None:
+            _log.warning(f"Unable to log error summary, ERROR_WEBHOOK_URL is None: {message} ({count}x)")
+            return
+
+        fields = [
+            {"name": "Occurrences", "value": f"{count} in {window} seconds"},
+            {"name": "Raised at", "value": raised_at[-1024:]},
+        ]
+        if p50 is not None:
+            fields.append({"name": "Time until raised", "value": f"p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"})
+
+        embed = {
+            "title": f"{route} (repeated)"[-EMBED_TITLE_LIMIT:],
+            "description": message[:EMBED_DESCRIPTION_LIMIT],
+            "color": 0xFF8000,
+            "fields": fields,
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+
+        self.submit_embeds([embed], self.ERROR_WEBHOOK_URL)
+
     def submit_achievement(self, req, achievement, action, note=None):
         if self.STAFF_WEBHOOK_URL is None:
             _log.warning("Unable to log new achievement, STAFF_WEBHOOK_URL is None")
@@ -152,4 +328,6 @@ class DiscordLogger:
         self.submit_embeds([embed], self.ANNOUNCEMENT_WEBHOOK_URL, ping)
 
     def stop(self):
-        self._running.clear()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
@@ -2,14 +2,30 @@ from django.conf import settings
 
 import osu
 import redis
-from redis.lock import Lock as RedisLock
+import requests
+import json
 import time
+import uuid
 
 
 osu_client: osu.Client = None  # type: ignore
 # TODO: would be better to use transactions instead of locks
 #       in relation to all the redis interactions in this code
 redis_client = redis.Redis(settings.REDIS_HOST, settings.REDIS_PORT)
+
+# beatmap data straight from the api, by id
+KEY_BEATMAP = "beatmap:{beatmap_id}"
+# beatmap id by md5 checksum (0 for maps the api doesn't know about)
+KEY_BEATMAP_CHECKSUM = "beatmap-checksum:{checksum}"
+BEATMAP_CACHE_TTL = 60 * 60 * 24
+# unsubmitted maps get looked up on every score submitted on them
+MISSING_BEATMAP_TTL = 60 * 10
+# max ids per request to the beatmaps endpoint
+BEATMAPS_PER_REQUEST = 50
+# user data straight from the api, by id and mode
+KEY_USER = "osu-user:{user_id}:{mode}"
+# kept short since it has the user's stats
+USER_CACHE_TTL = 60 * 5
 OSU_AUTH_URL = osu.AuthHandler(
     settings.OSU_CLIENT_ID, settings.OSU_CLIENT_SECRET, settings.OSU_REDIRECT_URL, osu.Scope.identify()
 ).get_auth_url()
@@ -45,6 +61,37 @@ class AuthData:
         return redis_client.expiretime(self.KEY_TOKEN) <= time.time()
 
 
+# sliding window of requests sent in the last minute (scores are times in seconds).
+# returns 0 and records the request if it can be sent now, otherwise how many
+# milliseconds to wait before trying again. TIME is used so that every worker
+# shares the same clock.
+RATE_LIMIT_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local wait_time = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+
+redis.call("ZREMRANGEBYSCORE", KEYS[1], 0, now - 60)
+
+local retry = 0
+local last = redis.call("ZREVRANGE", KEYS[1], 0, 0, "WITHSCORES")
+if #last > 0 then
+    retry = math.max(retry, tonumber(last[2]) + wait_time - now)
+end
+if redis.call("ZCARD", KEYS[1]) >= limit then
+    local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+    retry = math.max(retry, tonumber(oldest[2]) + 60 - now)
+end
+if retry > 0 then
+    return math.ceil(retry * 1000)
+end
+
+redis.call("ZADD", KEYS[1], now, ARGV[3])
+redis.call("EXPIRE", KEYS[1], 60)
+return 0
+"""
+
+
 # redis version of osu.py rate limiter
 class RateLimitHandler:
     KEY_REQUESTS = "osu-api-requests"
@@ -52,78 +99,19 @@ class RateLimitHandler:
     __slots__ = (
         "wait_time",
         "limit",
-        "_lock",
-        "_waiting_lock",
+        "_script",
     )
 
     def __init__(self, request_wait_time: float, limit_per_minute: int):
         self.wait_time: float = request_wait_time
         self.limit: int = limit_per_minute
-        # for accessing non-thread-safe variables
-        # intended to be used for short durations
-        self._lock: RedisLock = redis_client.lock("RateLimitHandlerLock1")
-        # to make sure only one request is waiting at a time
-        # okay to acquire for long periods of time
-        self._waiting_lock: RedisLock = redis_client.lock("RateLimitHandlerLock2")
+        self._script = redis_client.register_script(RATE_LIMIT_SCRIPT)
 
     def wait(self):
-        self._lock.acquire()
-
-        if self.wait_time > 0:
-            self._wait_with_wait_time()
-        else:
-            self._wait_without_wait_time()
-
-        # we don't care about the set key
-        redis_client.zadd(self.KEY_REQUESTS, {str(time.time()): time.time()})
-
-        self._lock.release()
-
-    def _wait_with_wait_time(self):
-        # acquiring _waiting_lock could take a bit
-        # so let's release this one
-        self._lock.release()
-        # once acquired, we can choose the appropriate way to wait
-        # without worry about race conditions. waiting one at a time
-        # is okay since wait time between requests is > 0
-        self._waiting_lock.acquire()
-
-        self._lock.acquire()
-        if len(requests_sent := self._get_requests_sent()) > 0:
-            wait_time = max(0.0, self.wait_time - (time.time() - requests_sent[-1]))
-            if wait_time > 0:
-                self._lock.release()
-                time.sleep(wait_time)
-                self._lock.acquire()
-
-        self._waiting_lock.release()
-
-    def _wait_without_wait_time(self):
-        # under rate limit still, good to send
-        if len(self._get_requests_sent()) < self.limit:
-            return
-
-        # acquiring _waiting_lock could take a bit
-        # so let's release this one
-        self._lock.release()
-        self._waiting_lock.acquire()
-        self._lock.acquire()
-
-        # check again, then wait till oldest request expires past 1 minute
-        if len(requests_sent := self._get_requests_sent()) >= self.limit:
-            wait_time = max(0.0, 60.0 - (time.time() - requests_sent[0]))
-            if wait_time > 0:
-                self._lock.release()
-                time.sleep(wait_time)
-                self._lock.acquire()
-
-        self._waiting_lock.release()
-
-    def _get_requests_sent(self):
-        """expects self._lock is acquired when calling this function"""
-        # update list
-        redis_client.zremrangebyscore(self.KEY_REQUESTS, 0, time.time() - 60)
-        return list(map(float, redis_client.zrange(self.KEY_REQUESTS, 0, -1)))
+        # members have to be unique for every request in the window
+        member = uuid.uuid4().hex
+        while (retry_ms := self._script(keys=[self.KEY_REQUESTS], args=[self.wait_time, self.limit, member])) > 0:
+            time.sleep(retry_ms / 1000)
 
 
 def get_client():
@@ -158,4 +146,100 @@ def get_user_client(code: str):
 
 def release_redis_locks():
     """In case of deadlocks"""
-    redis_client.delete("RateLimitHandlerLock1", "RateLimitHandlerLock2", "AuthHandlerLock")
+    redis_client.delete("AuthHandlerLock")
+
+
+def _is_not_found(exc: Exception) -> bool:
+    # osu.py wraps http errors that have an error message
+    for err in (exc, exc.__cause__):
+        response = getattr(err, "response", None)
+        if response is not None and response.status_code == 404:
+            return True
+
+    return False
+
+
+def _cache_beatmaps(beatmaps):
+    if len(beatmaps) == 0:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for beatmap in beatmaps:
+        pipe.set(KEY_BEATMAP.format(beatmap_id=beatmap["id"]), json.dumps(beatmap), ex=BEATMAP_CACHE_TTL)
+        if beatmap.get("checksum"):
+            pipe.set(KEY_BEATMAP_CHECKSUM.format(checksum=beatmap["checksum"]), beatmap["id"], ex=BEATMAP_CACHE_TTL)
+    pipe.execute()
+
+
+def _request_beatmaps(beatmap_ids: list[int]) -> list[dict]:
+    http = get_client().http
+    beatmaps = []
+    for i in range(0, len(beatmap_ids), BEATMAPS_PER_REQUEST):
+        results = http.make_request(osu.Path.beatmaps(), **{"ids[]": beatmap_ids[i : i + BEATMAPS_PER_REQUEST]})
+        if results:
+            beatmaps.extend(results["beatmaps"])
+
+    return beatmaps
+
+
+def get_beatmaps_data(beatmap_ids: list[int]) -> list[dict]:
+    """
+    Returns the api data of the given beatmaps, only requesting the ones that aren't cached.
+    Beatmaps that don't exist are left out.
+    """
+    if settings.DEBUG:
+        return _request_beatmaps(beatmap_ids)
+
+    cached = redis_client.mget([KEY_BEATMAP.format(beatmap_id=beatmap_id) for beatmap_id in beatmap_ids])
+    missing = [beatmap_id for beatmap_id, beatmap in zip(beatmap_ids, cached) if beatmap is None]
+    fetched = {}
+    if len(missing) > 0:
+        fetched = {beatmap["id"]: beatmap for beatmap in _request_beatmaps(missing)}
+        _cache_beatmaps(list(fetched.values()))
+
+    beatmaps = []
+    for beatmap_id, beatmap in zip(beatmap_ids, cached):
+        if beatmap is not None:
+            beatmaps.append(json.loads(beatmap))
+        elif beatmap_id in fetched:
+            beatmaps.append(fetched[beatmap_id])
+
+    return beatmaps
+
+
+def lookup_beatmap_data(checksum: str) -> dict | None:
+    """Returns the api data of the beatmap with the given md5 checksum, or None if it's not submitted"""
+    key = KEY_BEATMAP_CHECKSUM.format(checksum=checksum)
+    if not settings.DEBUG:
+        if (beatmap_id := redis_client.get(key)) is not None:
+            if int(beatmap_id) == 0:
+                return
+
+            if (beatmap := redis_client.get(KEY_BEATMAP.format(beatmap_id=int(beatmap_id)))) is not None:
+                return json.loads(beatmap)
+
+    try:
+        beatmap = get_client().http.make_request(osu.Path.beatmap_lookup(), checksum=checksum)
+    except Exception as exc:
+        if not settings.DEBUG and _is_not_found(exc):
+            redis_client.set(key, 0, ex=MISSING_BEATMAP_TTL)
+        return
+
+    if not settings.DEBUG:
+        _cache_beatmaps([beatmap])
+
+    return beatmap
+
+
+def get_user_data(user_id: int, mode: str) -> dict:
+    """Returns the api data of a user in the given mode (e.g. "osu"), cached for a few minutes"""
+    key = KEY_USER.format(user_id=user_id, mode=mode)
+    if not settings.DEBUG and (user := redis_client.get(key)) is not None:
+        return json.loads(user)
+
+    user = get_client().http.make_request(osu.Path.get_user(user_id, mode))
+
+    if not settings.DEBUG:
+        redis_client.set(key, json.dumps(user), ex=USER_CACHE_TTL)
+
+    return user
@@ -0,0 +1,225 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from common.osu_api import redis_client
+
+import logging
+import redis
+import threading
+import time
+from contextvars import ContextVar
+
+
+__all__ = (
+    "RequestSample",
+    "current_sample",
+    "in_serialize",
+    "record_sample",
+    "get_stats",
+    "RETENTION_HOURS",
+)
+
+
+_log = logging.getLogger(__name__)
+
+
+# upper bounds (in ms) of the latency histogram buckets, slower requests go in an extra bucket
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# seconds between writes of a process' stats to redis
+FLUSH_INTERVAL = 10
+# stats are grouped by hour and kept for this many hours
+RETENTION_HOURS = 48
+
+# totals and histogram counts of one view in one hour
+KEY_STATS = "profiling:{hour}:{view}"
+# views with stats in an hour
+KEY_VIEWS = "profiling-views:{hour}"
+
+TOTAL_FIELDS = ("count", "time", "queries", "query_time", "serialize_time", "bytes")
+BUCKET_FIELDS = tuple(f"le_{bound}" for bound in LATENCY_BUCKETS) + ("le_inf",)
+
+
+class RequestSample:
+    """
+    What a sampled request spent its time on, filled in while it's handled.
+    Async views can run several threads at once for one request, so it's only added to under a lock.
+    """
+
+    __slots__ = ("queries", "query_time", "serialize_time", "_lock")
+
+    def __init__(self):
+        self.queries: int = 0
+        self.query_time: float = 0.0
+        self.serialize_time: float = 0.0
+        self._lock: threading.Lock = threading.Lock()
+
+    def add_query(self, elapsed: float):
+        with self._lock:
+            self.queries += 1
+            self.query_time += elapsed
+
+    def add_serialize_time(self, elapsed: float):
+        with self._lock:
+            self.serialize_time += elapsed
+
+
+# set while a sampled request is being handled. sync_to_async copies it
+# into the threads that async views run their queries in
+current_sample: ContextVar[RequestSample | None] = ContextVar("current_sample", default=None)
+# set inside SerializableModel.serialize so nested calls aren't timed twice. each of
+# those threads gets its own copy, unlike the sample they all share
+in_serialize: ContextVar[bool] = ContextVar("in_serialize", default=False)
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.add_query(time.perf_counter() - start)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    # the wrapper list stays with the connection object across reconnects
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_wrapper)
+
+
+connection_created.connect(_instrument_connection)
+
+
+# (hour, view) -> field -> value, not yet written to redis
+_pending: dict[tuple[int, str], dict[str, float]] = {}
+_lock: threading.Lock = threading.Lock()
+_last_flush: float = time.monotonic()
+
+
+def _bucket_field(elapsed_ms: float) -> str:
+    for bound, field in zip(LATENCY_BUCKETS, BUCKET_FIELDS):
+        if elapsed_ms <= bound:
+            return field
+
+    return BUCKET_FIELDS[-1]
+
+
+def _flush(pending: dict[tuple[int, str], dict[str, float]]):
+    pipe = redis_client.pipeline(transaction=False)
+    for (hour, view), stats in pending.items():
+        key = KEY_STATS.format(hour=hour, view=view)
+        for field, value in stats.items():
+            pipe.hincrbyfloat(key, field, value)
+        pipe.expire(key, RETENTION_HOURS * 3600)
+        pipe.sadd(KEY_VIEWS.format(hour=hour), view)
+        pipe.expire(KEY_VIEWS.format(hour=hour), RETENTION_HOURS * 3600)
+    pipe.execute()
+
+
+def _take_pending(force: bool = False) -> dict[tuple[int, str], dict[str, float]] | None:
+    # must be called with _lock held
+    global _pending, _last_flush
+
+    if settings.DEBUG or (not force and time.monotonic() - _last_flush < FLUSH_INTERVAL):
+        return
+
+    pending, _pending = _pending, {}
+    _last_flush = time.monotonic()
+    return pending
+
+
+def record_sample(view: str, elapsed: float, sample: RequestSample, size: int):
+    hour = int(time.time() // 3600)
+    with _lock:
+        if (stats := _pending.get((hour, view))) is None:
+            stats = _pending[(hour, view)] = dict.fromkeys(TOTAL_FIELDS, 0)
+
+        stats["count"] += 1
+        stats["time"] += elapsed
+        stats["queries"] += sample.queries
+        stats["query_time"] += sample.query_time
+        stats["serialize_time"] += sample.serialize_time
+        stats["bytes"] += size
+        bucket = _bucket_field(elapsed * 1000)
+        stats[bucket] = stats.get(bucket, 0) + 1
+
+        pending = _take_pending()
+
+    # outside the lock so other requests don't wait on redis
+    if pending:
+        try:
+            _flush(pending)
+        except redis.RedisError as exc:
+            # the request shouldn't fail because of stats
+            _log.warning("Failed to flush profiling stats", exc_info=exc)
+
+
+def _read_stats(hours: list[int]) -> list[dict[str, dict[str, float]]]:
+    if settings.DEBUG:
+        with _lock:
+            return [{view: dict(stats)} for (hour, view), stats in _pending.items() if hour in hours]
+
+    with _lock:
+        pending = _take_pending(force=True)
+    if pending:
+        _flush(pending)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for hour in hours:
+        pipe.smembers(KEY_VIEWS.format(hour=hour))
+    views_by_hour = pipe.execute()
+
+    pipe = redis_client.pipeline(transaction=False)
+    keys = []
+    for hour, views in zip(hours, views_by_hour):
+        for view in views:
+            keys.append(view.decode("utf-8"))
+            pipe.hgetall(KEY_STATS.format(hour=hour, view=keys[-1]))
+
+    return [
+        {view: {field.decode("utf-8"): float(value) for field, value in stats.items()}}
+        for view, stats in zip(keys, pipe.execute())
+    ]
+
+
+def _estimate_percentile(histogram: dict[str, float], count: float, q: float) -> int | None:
+    """Upper bound (in ms) of the bucket the percentile falls in, None if it's past the last bound"""
+    seen = 0
+    for bound, field in zip(LATENCY_BUCKETS, BUCKET_FIELDS):
+        seen += histogram.get(field, 0)
+        if seen >= q * count:
+            return bound
+
+
+def get_stats(hours: int = 1) -> dict[str, dict]:
+    """Stats of every sampled view over the last few hours (including the current one). Raises redis.RedisError"""
+    current_hour = int(time.time() // 3600)
+    totals = {}
+    for stats_by_view in _read_stats([current_hour - i for i in range(hours)]):
+        for view, stats in stats_by_view.items():
+            view_totals = totals.setdefault(view, {})
+            for field, value in stats.items():
+                view_totals[field] = view_totals.get(field, 0) + value
+
+    result = {}
+    for view, stats in totals.items():
+        count = stats.get("count", 0)
+        if count == 0:
+            continue
+
+        result[view] = {
+            "count": int(count),
+            "avg_ms": stats.get("time", 0) / count * 1000,
+            "p50_ms": _estimate_percentile(stats, count, 0.5),
+            "p95_ms": _estimate_percentile(stats, count, 0.95),
+            "p99_ms": _estimate_percentile(stats, count, 0.99),
+            "avg_queries": stats.get("queries", 0) / count,
+            "avg_query_ms": stats.get("query_time", 0) / count * 1000,
+            "avg_serialize_ms": stats.get("serialize_time", 0) / count * 1000,
+            "avg_bytes": stats.get("bytes", 0) / count,
+            "histogram": {field: int(stats.get(field, 0)) for field in BUCKET_FIELDS},
+        }
+
+    return result
@@ -1,7 +1,12 @@
 from django.db import models
 
+from common.profiling import current_sample, in_serialize
+
+import time
 from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
 from typing import Callable, Any
 
 
@@ -119,70 +124,116 @@ class SerializableModel(models.Model):
         EXCLUDES: list
         TRANSFORM: dict[str, str]
 
-    def _transform(
-        self,
-        fields: list[SerializableField],
-        excludes: dict[SerializableField, list[SerializableField]],
-        includes: dict[SerializableField, list[SerializableField]],
+    def serialize(
+        self, includes: list[str | SerializableField] | None = None, excludes: list[str] | None = None
     ) -> dict | None:
-        field_transforms = getattr(self.Serialization, "TRANSFORM", {})
+        plan = _get_plan(self.__class__, includes, excludes)
 
-        # for caching condition results
-        condition_results = {}
+        # only the outermost call is timed, since related objects get serialized from inside it
+        sample = current_sample.get()
+        if sample is None or in_serialize.get():
+            return plan.run(self)
 
-        data = {}
-        for field in fields:
-            str_field = str(field)
+        token = in_serialize.set(True)
+        start = time.perf_counter()
+        try:
+            return plan.run(self)
+        finally:
+            in_serialize.reset(token)
+            sample.add_serialize_time(time.perf_counter() - start)
 
-            # conditional inclusion based on this object
-            condition = field.serialize_condition
-            if condition is not None:
-                result = condition_results.get(condition, None)
-                if result is None:
-                    condition_results[condition] = result = condition(self)
 
-                if not result:
-                    continue
+# kinds of values a field can resolve to (decides how the value gets serialized)
+_KIND_OTHER = 1
+_KIND_MODEL = 2
+_KIND_DATETIME = 3
+_KIND_MANAGER = 4
+_KIND_ITERATOR = 5
 
-            value = getattr(self, str_field)
-            if isinstance(value, SerializableModel):
-                value = value.serialize(includes.get(field), excludes.get(field))
-            elif isinstance(value, datetime):
-                value = value.isoformat()
-            elif value.__class__.__name__ == "RelatedManager":
-                field_includes = includes.get(field)
-                field_excludes = excludes.get(field)
-                value = (
-                    obj.serialize(field_includes, field_excludes)
-                    for obj in value.all()
-                    if field.serialize_filter is None or field.serialize_filter(obj)
-                )
+_value_kinds: dict[type, int] = {}
 
-            if field.post_serial_filter is not None and hasattr(value, "__iter__"):
-                value = filter(field.post_serial_filter, value)
 
-            if hasattr(value, "__next__"):
-                value = list(value)
+def _value_kind(typ: type) -> int:
+    kind = _value_kinds.get(typ)
+    if kind is not None:
+        return kind
 
-            if field.post_transform is not None:
-                value = field.post_transform(value)
+    if issubclass(typ, SerializableModel):
+        kind = _KIND_MODEL
+    elif issubclass(typ, datetime):
+        kind = _KIND_DATETIME
+    elif typ.__name__ == "RelatedManager":
+        kind = _KIND_MANAGER
+    elif hasattr(typ, "__next__"):
+        kind = _KIND_ITERATOR
+    else:
+        kind = _KIND_OTHER
 
-            data[field.serial_key or field_transforms.get(str_field, str_field)] = value
+    _value_kinds[typ] = kind
+    return kind
 
-        return data
 
-    def serialize(
-        self, includes: list[str | SerializableField] | None = None, excludes: list[str] | None = None
-    ) -> dict | None:
-        if includes is None:
-            includes = []
-        if excludes is None:
-            excludes = []
+class _FieldPlan:
+    __slots__ = (
+        "getter",
+        "key",
+        "condition",
+        "serialize_filter",
+        "post_serial_filter",
+        "post_transform",
+        "includes",
+        "excludes",
+        "child_runners",
+    )
 
+    def __init__(
+        self,
+        field: SerializableField,
+        key: str,
+        includes: list[SerializableField] | None,
+        excludes: list[SerializableField] | None,
+    ):
+        self.getter = attrgetter(field.field)
+        self.key = key
+        self.condition = field.serialize_condition
+        self.serialize_filter = field.serialize_filter
+        self.post_serial_filter = field.post_serial_filter
+        self.post_transform = field.post_transform
+        self.includes = includes
+        self.excludes = excludes
+        # model class -> function that serializes an instance of it
+        self.child_runners: dict[type, Callable[[models.Model], dict | None]] = {}
+
+    def get_child_runner(self, cls: type) -> Callable[[models.Model], dict | None]:
+        runner = self.child_runners.get(cls)
+        if runner is not None:
+            return runner
+
+        includes, excludes = self.includes, self.excludes
+        if cls.serialize is SerializableModel.serialize:
+            runner = _get_plan(cls, includes, excludes).run
+        else:
+            # models with a custom serialize still have to go through it
+            def runner(obj):
+                return obj.serialize(includes, excludes)
+
+        self.child_runners[cls] = runner
+        return runner
+
+
+class _SerializationPlan:
+    __slots__ = ("fields", "has_conditions")
+
+    def __init__(
+        self,
+        model_cls: type[SerializableModel],
+        includes: list[str | SerializableField | None],
+        excludes: list[str | SerializableField | None],
+    ):
         exclude_now, exclude_later = _separate_field_args(excludes, only_include_last=True)
         include_now, include_later = _separate_field_args(includes)
 
-        fields = list(map(SerializableField, self.Serialization.FIELDS))
+        fields = list(map(SerializableField, model_cls.Serialization.FIELDS))
         for field in exclude_now:
             fields.remove(field)
         for field in include_now:
@@ -197,4 +248,109 @@ class SerializableModel(models.Model):
 
             fields.append(field)
 
-        return self._transform(fields, exclude_later, include_later)
+        field_transforms = getattr(model_cls.Serialization, "TRANSFORM", {})
+        self.fields: tuple[_FieldPlan, ...] = tuple(
+            _FieldPlan(
+                field,
+                field.serial_key or field_transforms.get(field.field, field.field),
+                include_later.get(field),
+                exclude_later.get(field),
+            )
+            for field in fields
+        )
+        self.has_conditions: bool = any(field.condition is not None for field in self.fields)
+
+    def run(self, obj: SerializableModel) -> dict:
+        # for caching condition results
+        condition_results = {} if self.has_conditions else None
+
+        data = {}
+        for field in self.fields:
+            # conditional inclusion based on this object
+            condition = field.condition
+            if condition is not None:
+                result = condition_results.get(condition, None)
+                if result is None:
+                    condition_results[condition] = result = condition(obj)
+
+                if not result:
+                    continue
+
+            value = field.getter(obj)
+            kind = _value_kinds.get(value.__class__) or _value_kind(value.__class__)
+            if kind == _KIND_MODEL:
+                value = field.get_child_runner(value.__class__)(value)
+            elif kind == _KIND_DATETIME:
+                value = value.isoformat()
+            elif kind == _KIND_MANAGER:
+                serialize_filter = field.serialize_filter
+                value = [
+                    field.get_child_runner(item.__class__)(item)
+                    for item in value.all()
+                    if serialize_filter is None or serialize_filter(item)
+                ]
+            elif kind == _KIND_ITERATOR:
+                value = list(value)
+
+            if field.post_serial_filter is not None and hasattr(value, "__iter__"):
+                value = list(filter(field.post_serial_filter, value))
+
+            if field.post_transform is not None:
+                value = field.post_transform(value)
+
+            data[field.key] = value
+
+        return data
+
+
+def _field_arg_key(field: str | SerializableField | None):
+    # SerializableField only hashes by name, but the callables attached
+    # to it are part of what makes two plans different
+    if isinstance(field, SerializableField):
+        return (
+            field.field,
+            field.serial_key,
+            field.serialize_condition,
+            field.serialize_filter,
+            field.post_serial_filter,
+            field.post_transform,
+        )
+    return field
+
+
+def _is_defined_per_call(func: Callable | None) -> bool:
+    # functions defined inside other functions (e.g. a view) are new objects every
+    # call, and so are partials. caching plans using them would fill the cache with
+    # plans that are never used again and keep the closures alive
+    return func is not None and "<locals>" in getattr(func, "__qualname__", "<locals>")
+
+
+def _field_arg_from_key(key) -> str | SerializableField | None:
+    if isinstance(key, tuple):
+        return SerializableField(*key)
+    return key
+
+
+@lru_cache(maxsize=512)
+def _compile_plan(model_cls: type[SerializableModel], includes: tuple, excludes: tuple) -> _SerializationPlan:
+    return _SerializationPlan(
+        model_cls, list(map(_field_arg_from_key, includes)), list(map(_field_arg_from_key, excludes))
+    )
+
+
+def _get_plan(
+    model_cls: type[SerializableModel],
+    includes: list[str | SerializableField | None] | None,
+    excludes: list[str | SerializableField | None] | None,
+) -> _SerializationPlan:
+    for field in (*(includes or ()), *(excludes or ())):
+        if isinstance(field, SerializableField) and any(
+            _is_defined_per_call(getattr(field, attr)) for attr in SerializableField.non_passive_attrs
+        ):
+            return _SerializationPlan(model_cls, list(includes or ()), list(excludes or ()))
+
+    return _compile_plan(
+        model_cls,
+        () if includes is None else tuple(map(_field_arg_key, includes)),
+        () if excludes is None else tuple(map(_field_arg_key, excludes)),
+    )
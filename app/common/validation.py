@@ -1,5 +1,6 @@
 from typing import Callable, Sequence, Type, Any
 from enum import IntEnum, IntFlag
+from itertools import chain
 
 
 __all__ = (
@@ -63,9 +64,21 @@ class ValidationResult:
 
 
 class ValidationType:
-    def validate(self, data) -> ValidationResult:
+    def compile(self) -> Callable[[Any], str | None]:
+        """
+        Returns a function that checks data against this type, returning an error message if it's invalid.
+        "{name}" in the message is where the name of the checked value goes.
+        """
         raise NotImplementedError()
 
+    def validate(self, data) -> ValidationResult:
+        msg = self.compile()(data)
+        return ValidationResult.clear() if msg is None else ValidationResult.failed(msg)
+
+
+def _no_check(data) -> None:
+    return
+
 
 class OptionalType(ValidationType):
     __slots__ = ("optional",)
@@ -73,19 +86,25 @@ class OptionalType(ValidationType):
     def __init__(self, optional: bool = False):
         self.optional = optional
 
-    def validate(self, data) -> ValidationResult:
-        if self.optional and data is None:
-            return ValidationResult.all_clear()
-        return ValidationResult.clear()
+    def _compile(self) -> Callable[[Any], str | None]:
+        return _no_check
+
+    def compile(self) -> Callable[[Any], str | None]:
+        check = self._compile()
+        if not self.optional:
+            return check
+
+        def optional_check(data):
+            if data is not None:
+                return check(data)
+
+        return optional_check
 
 
 class AnyType(OptionalType):
     def __init__(self):
         super().__init__(False)
 
-    def validate(self, data) -> ValidationResult:
-        return ValidationResult.clear()
-
 
 class OptionsType(OptionalType):
     __slots__ = ("options",)
@@ -94,18 +113,16 @@ class OptionsType(OptionalType):
         super().__init__(optional)
         self.options: Sequence | None = options
 
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
+    def _compile(self) -> Callable[[Any], str | None]:
+        options = self.options
+        if options is None:
+            return _no_check
 
-        if self.options is None:
-            return ValidationResult.clear()
+        def check(data):
+            if data not in options:
+                return "Invalid option for {name}: '%s'" % data
 
-        return (
-            ValidationResult.clear()
-            if data in self.options
-            else ValidationResult.failed("Invalid option for {name}: '%s'" % data)
-        )
+        return check
 
 
 class StringType(OptionsType):
@@ -123,76 +140,85 @@ class StringType(OptionsType):
         self.min_length: int | None = min_length
         self.max_length: int | None = max_length
 
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
+    def _length_msg(self) -> str | None:
+        if self.min_length is None and self.max_length is None:
+            return
+        if self.max_length is None:
+            return "{name} must have a length of at least %d" % self.min_length
+        if self.min_length is None:
+            return "{name} must have a length of at most %d" % self.max_length
+        return "{name} must have a length between %d and %d" % (self.min_length, self.max_length)
 
-        if not isinstance(data, str):
-            return ValidationResult.failed("{name} must be a string")
+    def _compile(self) -> Callable[[Any], str | None]:
+        options = self.options
+        min_length = self.min_length if self.min_length is not None else 0
+        max_length = self.max_length
+        length_msg = self._length_msg()
 
-        if (self.min_length is not None and len(data) < self.min_length) or (
-            self.max_length is not None and len(data) > self.max_length
-        ):
-            if self.max_length is None:
-                msg = "{name} must have a length of at least %d" % self.min_length
-            elif self.min_length is None:
-                msg = "{name} must have a length of at most %d" % self.max_length
-            else:
-                msg = "{name} must have a length between %d and %d" % (self.min_length, self.max_length)
-            return ValidationResult.failed(msg)
+        def check(data):
+            if options is not None and data not in options:
+                return "Invalid option for {name}: '%s'" % data
+            if not isinstance(data, str):
+                return "{name} must be a string"
+            if len(data) < min_length or (max_length is not None and len(data) > max_length):
+                return length_msg
 
-        return ValidationResult.clear()
+        return check
 
 
 class NumberType(OptionalType):
     __slots__ = ("min", "max")
 
+    # whether floats are rejected
+    integer: bool = False
+
     def __init__(self, minimum: int | None = None, maximum: int | None = None, optional: bool = False):
         super().__init__(optional)
         self.min: int | None = minimum
         self.max: int | None = maximum
 
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
+    def _compile(self) -> Callable[[Any], str | None]:
+        minimum, maximum, integer = self.min, self.max, self.integer
+        min_msg = "{name} must be greater than %d" % minimum if minimum is not None else None
+        max_msg = "{name} must be less than %d" % maximum if maximum is not None else None
 
-        if not (isinstance(data, int) or isinstance(data, float)):
-            return ValidationResult.failed("{name} must be an int")
-        if self.min is not None and data < self.min:
-            return ValidationResult.failed("{name} must be greater than %d" % self.min)
-        if self.max is not None and data > self.max:
-            return ValidationResult.failed("{name} must be less than %d" % self.max)
+        def check(data):
+            if not isinstance(data, (int, float)):
+                return "{name} must be an int"
+            if minimum is not None and data < minimum:
+                return min_msg
+            if maximum is not None and data > maximum:
+                return max_msg
+            if integer and not isinstance(data, int):
+                return "{name} must be an int"
 
-        return ValidationResult.clear()
+        return check
 
 
 class IntegerType(NumberType):
+    integer = True
+
     def __init__(self, minimum: int | None = None, maximum: int | None = None, optional: bool = False):
         super().__init__(minimum, maximum, optional)
 
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
-
-        if not isinstance(data, int):
-            return ValidationResult.failed("{name} must be an int")
-
-        return ValidationResult.clear()
-
 
 class BoolType(OptionalType):
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
-
-        if not isinstance(data, bool):
-            return ValidationResult.failed("{name} must be a boolean")
+    def _compile(self) -> Callable[[Any], str | None]:
+        def check(data):
+            if not isinstance(data, bool):
+                return "{name} must be a boolean"
 
-        return ValidationResult.clear()
+        return check
 
 
 class ListType(OptionalType):
-    __slots__ = ("val_type", "max_len", "min_len", "unique", "unique_check")
+    """
+    With unique, items are compared by unique_key(item) (or the item itself) using a set.
+    Unhashable keys (e.g. dicts) are compared to every other key instead, and so is every
+    pair of items when unique_check(a, b) is given.
+    """
+
+    __slots__ = ("val_type", "max_len", "min_len", "unique", "unique_key", "unique_check")
 
     def __init__(
         self,
@@ -201,7 +227,8 @@ class ListType(OptionalType):
         max_len: int = 0,
         min_len: int = 0,
         unique: bool = False,
-        unique_check=None,
+        unique_key: Callable[[Any], Any] | None = None,
+        unique_check: Callable[[Any, Any], bool] | None = None,
     ):
         super().__init__(optional)
 
@@ -212,31 +239,49 @@ class ListType(OptionalType):
         self.max_len: int = max_len
         self.min_len: int = min_len
         self.unique: bool = unique
-        self.unique_check = (lambda a, b: a != b) if unique_check is None else unique_check
-
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
-
-        if not isinstance(data, list):
-            return ValidationResult.failed("{name} must be a list")
-        if 0 < self.max_len < len(data):
-            return ValidationResult.failed("{name} exceeds maximum length of %d" % self.max_len)
-        if len(data) < self.min_len:
-            return ValidationResult.failed("{name} must meet minimum length of %d" % self.min_len)
-
-        validated = []
-        for i, item in enumerate(data):
-            result = self.val_type.validate(item)
-            if result.is_failed:
-                return ValidationResult.failed(result.msg.replace("{name}", "{name}[%d]" % i))
-
-            if self.unique:
-                if not all(map(lambda past_item: self.unique_check(item, past_item), validated)):
-                    return ValidationResult.failed("{name}[%d] is a duplicate value" % i)
-                validated.append(item)
-
-        return ValidationResult.clear()
+        self.unique_key: Callable[[Any], Any] | None = unique_key
+        self.unique_check: Callable[[Any, Any], bool] | None = unique_check
+
+    def _compile(self) -> Callable[[Any], str | None]:
+        item_check = self.val_type.compile()
+        max_len, min_len = self.max_len, self.min_len
+        unique_key, unique_check = self.unique_key, self.unique_check
+        unique = self.unique and unique_check is None
+        pairwise_unique = self.unique and unique_check is not None
+        max_len_msg = "{name} exceeds maximum length of %d" % max_len
+        min_len_msg = "{name} must meet minimum length of %d" % min_len
+
+        def check(data):
+            if not isinstance(data, list):
+                return "{name} must be a list"
+            if 0 < max_len < len(data):
+                return max_len_msg
+            if len(data) < min_len:
+                return min_len_msg
+
+            seen = set()
+            unhashable = []
+            validated = []
+            for i, item in enumerate(data):
+                if (msg := item_check(item)) is not None:
+                    return msg.replace("{name}", "{name}[%d]" % i)
+
+                if unique:
+                    key = item if unique_key is None else unique_key(item)
+                    try:
+                        is_duplicate = key in seen or any(key == past_key for past_key in unhashable)
+                        seen.add(key)
+                    except TypeError:
+                        is_duplicate = any(key == past_key for past_key in chain(seen, unhashable))
+                        unhashable.append(key)
+                    if is_duplicate:
+                        return "{name}[%d] is a duplicate value" % i
+                elif pairwise_unique:
+                    if not all(unique_check(item, past_item) for past_item in validated):
+                        return "{name}[%d] is a duplicate value" % i
+                    validated.append(item)
+
+        return check
 
 
 class DictionaryType(OptionalType):
@@ -246,25 +291,24 @@ class DictionaryType(OptionalType):
         super().__init__(optional)
         self.fmt: dict[str, OptionalType] = fmt
 
-    def validate(self, data) -> ValidationResult:
-        if (result := super().validate(data)).is_final:
-            return result
-
-        for key, validator in self.fmt.items():
-            if key not in data and not validator.optional:
-                return ValidationResult.failed(f"{key} is missing")
-            if key not in data and validator.optional:
-                continue
-
-            result = validator.validate(data[key])
-            if result.is_failed:
-                return (
-                    ValidationResult.failed(result.msg.format(name=key))
-                    if not isinstance(validator, DictionaryType)
-                    else result
-                )
-
-        return ValidationResult.clear()
+    def _compile(self) -> Callable[[Any], str | None]:
+        fields = tuple((key, validator.optional, validator.compile()) for key, validator in self.fmt.items())
+
+        def check(data):
+            if not isinstance(data, dict):
+                return "{name} must be an object"
+
+            for key, optional, field_check in fields:
+                if key not in data:
+                    if optional:
+                        continue
+                    return f"{key} is missing"
+
+                if (msg := field_check(data[key])) is not None:
+                    # messages from nested dictionaries already have their names filled in
+                    return msg.replace("{name}", key)
+
+        return check
 
 
 class FlagType(IntegerType):
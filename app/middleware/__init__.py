@@ -1,3 +1,4 @@
 from .error import *
 from .debug import *
 from .domain import *
+from .profiling import *
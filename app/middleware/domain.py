@@ -1,9 +1,18 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
 __all__ = ("DomainCheckingMiddleware",)
 
 
 class DomainCheckingMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        # get_response's coroutine is returned as is when running async
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, req):
         domain = req.get_host().split(":")[0]
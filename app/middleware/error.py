@@ -1,17 +1,136 @@
 from django.conf import settings
 from django.http.response import Http404
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+import threading
+import time
+import traceback
 
 
 __all__ = ("ExceptionLoggingMiddleware",)
 
 
+# repeats of an error within this many seconds of its first occurrence are summarized in one embed
+ERROR_WINDOW = 60
+# times until the error was raised kept per error for the summary's percentiles
+MAX_TIMING_SAMPLES = 1000
+
+
+def _fingerprint(req, exc) -> tuple[str, str, str]:
+    frames = traceback.extract_tb(exc.__traceback__)
+    raised_at = f"{frames[-1].filename}:{frames[-1].lineno}" if len(frames) > 0 else "unknown"
+    # the route keeps ids in the path from splitting up the same error
+    path = req.resolver_match.route if req.resolver_match is not None else req.path
+    return f"{type(exc).__module__}.{type(exc).__qualname__}", raised_at, f"{req.method} {path}"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+class _ErrorWindow:
+    __slots__ = ("message", "count", "timings", "ends_at")
+
+    def __init__(self, exc: Exception):
+        # not the exception itself, which would keep its traceback's frames alive
+        self.message: str = f"{type(exc).__name__}: {exc}"
+        self.count: int = 0
+        self.timings: list[float] = []
+        self.ends_at: float = time.monotonic() + ERROR_WINDOW
+
+    def add(self, duration: float | None):
+        self.count += 1
+        if duration is not None and len(self.timings) < MAX_TIMING_SAMPLES:
+            self.timings.append(duration)
+
+
 class ExceptionLoggingMiddleware:
+    """
+    Sends the first occurrence of each error (by type, raising line and route) to discord right away,
+    and a summary of its repeats at the end of the window.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response) -> None:
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        self._windows: dict[tuple[str, str, str], _ErrorWindow] = {}
+        # guards _windows, and wakes the flusher up when a window is opened
+        self._cond: threading.Condition = threading.Condition()
+        # one thread sends the summaries of every window
+        self._flusher: threading.Thread | None = None
+
+    def __call__(self, req):
+        # only covers the middlewares after this one and the view
+        req.error_timer_start = time.perf_counter()
+        return self.get_response(req)
+
+    def _take_ended_windows(self) -> list[tuple[tuple[str, str, str], _ErrorWindow]]:
+        # must be called with _cond held. windows all last as long and are
+        # kept in the order they were opened, so they end in that order
+        now = time.monotonic()
+        ended = []
+        for fingerprint, window in self._windows.items():
+            if window.ends_at > now:
+                break
+            ended.append((fingerprint, window))
+
+        for fingerprint, _ in ended:
+            del self._windows[fingerprint]
+        return ended
+
+    def _run_flusher(self):
+        while True:
+            with self._cond:
+                while len(ended := self._take_ended_windows()) == 0:
+                    timeout = None
+                    if len(self._windows) > 0:
+                        timeout = next(iter(self._windows.values())).ends_at - time.monotonic()
+                    self._cond.wait(timeout)
 
-    def __call__(self, *args, **kwargs):
-        return self.get_response(*args, **kwargs)
+            for fingerprint, window in ended:
+                self._send_summary(fingerprint, window)
+
+    def _send_summary(self, fingerprint: tuple[str, str, str], window: _ErrorWindow):
+        # the first occurrence was already sent
+        if window.count <= 1:
+            return
+
+        exc_type, raised_at, route = fingerprint
+        timings = sorted(window.timings)
+        settings.DISCORD_LOGGER.submit_err_summary(
+            route,
+            window.message,
+            raised_at,
+            window.count,
+            ERROR_WINDOW,
+            _percentile(timings, 0.5) if len(timings) > 0 else None,
+            _percentile(timings, 0.95) if len(timings) > 0 else None,
+        )
 
     def process_exception(self, req, exc) -> None:
-        if not settings.DEBUG and not isinstance(exc, Http404):
+        if settings.DEBUG or isinstance(exc, Http404):
+            return
+
+        start_time = getattr(req, "error_timer_start", None)
+        duration = time.perf_counter() - start_time if start_time is not None else None
+        fingerprint = _fingerprint(req, exc)
+
+        with self._cond:
+            is_new = fingerprint not in self._windows
+            if is_new:
+                self._windows[fingerprint] = _ErrorWindow(exc)
+                # threads don't survive forks, so this also restarts it in forked workers
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._flusher = threading.Thread(target=self._run_flusher, daemon=True)
+                    self._flusher.start()
+                self._cond.notify()
+
+            self._windows[fingerprint].add(duration)
+
+        if is_new:
             settings.DISCORD_LOGGER.submit_err(req, exc)
@@ -0,0 +1,71 @@
+from django.core.exceptions import MiddlewareNotUsed
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from common.profiling import RequestSample, current_sample, record_sample
+
+import random
+import time
+
+
+__all__ = ("RequestProfilingMiddleware",)
+
+
+def _view_name(req) -> str:
+    view = req.resolver_match.view_name if getattr(req, "resolver_match", None) is not None else "unresolved"
+    return f"{req.method} {view}"
+
+
+def _response_size(resp) -> int:
+    if resp.streaming:
+        return int(resp.get("Content-Length", 0))
+    return len(resp.content)
+
+
+class RequestProfilingMiddleware:
+    """Records timing, query and size stats of a random sample of requests (see common.profiling)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        if settings.PROFILING_SAMPLE_RATE <= 0:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.sample_rate: float = settings.PROFILING_SAMPLE_RATE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, req):
+        if iscoroutinefunction(self):
+            return self.__acall__(req)
+
+        if random.random() >= self.sample_rate:
+            return self.get_response(req)
+
+        sample = RequestSample()
+        token = current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            resp = self.get_response(req)
+        finally:
+            current_sample.reset(token)
+
+        record_sample(_view_name(req), time.perf_counter() - start, sample, _response_size(resp))
+        return resp
+
+    async def __acall__(self, req):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(req)
+
+        sample = RequestSample()
+        token = current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            resp = await self.get_response(req)
+        finally:
+            current_sample.reset(token)
+
+        record_sample(_view_name(req), time.perf_counter() - start, sample, _response_size(resp))
+        return resp
@@ -5,7 +5,8 @@ from django.http import HttpResponse
 from .. import packets
 from ..packets import ClientPackets, BasePacket, BanchoPacketReader
 from ..models import *
-from ..util import account_from_credentials
+from ..util import account_from_credentials, account_from_token
+from ..session import aset_session, adelete_session
 
 
 # from https://github.com/osuAkatsuki/bancho.py
@@ -49,13 +50,13 @@ def parse_osu_login_data(data: bytes):
     }
 
 
-def handle_osu_login(req):
+async def handle_osu_login(req):
     try:
         login_data = parse_osu_login_data(req.body)
     except ValueError:
         return HttpResponse(status=400)
 
-    account = account_from_credentials(login_data["username"], login_data["password_md5"])
+    account = await account_from_credentials(login_data["username"], login_data["password_md5"])
     if account is None:
         return HttpResponse(
             packets.login_reply(packets.LoginFailureReason.AUTHENTICATION_FAILED)
@@ -64,29 +65,33 @@ def handle_osu_login(req):
         )
 
     osu_token = secrets.token_urlsafe(32)
+    await adelete_session(account.osu_token)
     account.osu_token = osu_token
     account.utc_offset = login_data["utc_offset"]
-    account.save()
+    await account.asave(update_fields=["osu_token", "utc_offset"])
+    await aset_session(osu_token, account.session_data())
 
     account.add_packet(
-        packets.protocol_version(19)
-        + packets.login_reply(account.user_id)
-        + packets.bancho_privileges(1)
-        + packets.notification("Successfully logged in")
-        + packets.channel_info_end()
-        + packets.user_presence(account)
-        + packets.user_stats(account)
+        packets.PacketWriter()
+        .add(packets.protocol_version(19))
+        .add(packets.login_reply(account.user_id))
+        .add(packets.bancho_privileges(1))
+        .add(packets.notification("Successfully logged in"))
+        .add(packets.channel_info_end())
+        .add(packets.user_presence(account))
+        .add(packets.user_stats(account))
+        .getvalue()
     )
 
-    return HttpResponse(account.get_response_data(), headers={"cho-token": osu_token})
+    return HttpResponse(await account.get_response_data(), headers={"cho-token": osu_token})
 
 
-def index(req):
+async def index(req):
     osu_token = req.headers.get("osu-token")
     if osu_token is None or osu_token == "":
-        return handle_osu_login(req)
+        return await handle_osu_login(req)
 
-    account = PlaytestAccount.objects.select_related("user").filter(osu_token=osu_token).first()
+    account = await account_from_token(osu_token)
     if account is None:
         return HttpResponse(packets.notification("Invalid token, reconnecting...") + packets.restart_server(0))
 
@@ -103,7 +108,7 @@ def index(req):
 
     account.add_packet(bytes(data))
 
-    return HttpResponse(account.get_response_data())
+    return HttpResponse(await account.get_response_data())
 
 
 PACKETS = {}
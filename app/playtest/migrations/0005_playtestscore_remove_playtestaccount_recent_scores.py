@@ -0,0 +1,51 @@
+# Generated by Django 6.0.6 on 2026-10-18 08:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_recent_scores(apps, schema_editor):
+    PlaytestAccount = apps.get_model("playtest", "PlaytestAccount")
+    PlaytestScore = apps.get_model("playtest", "PlaytestScore")
+
+    scores = []
+    for account_id, recent_scores in PlaytestAccount.objects.values_list("id", "recent_scores"):
+        for score in recent_scores:
+            if score.get("checksum"):
+                scores.append(PlaytestScore(account_id=account_id, checksum=score["checksum"], data=score))
+
+    PlaytestScore.objects.bulk_create(scores, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playtest", "0004_playtestaccount_response_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaytestScore",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("checksum", models.CharField(max_length=64)),
+                ("data", models.JSONField()),
+                (
+                    "account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recent_scores",
+                        to="playtest.playtestaccount",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("account", "checksum"), name="unique_playtest_score")],
+            },
+        ),
+        migrations.RunPython(copy_recent_scores, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="playtestaccount",
+            name="recent_scores",
+        ),
+    ]
@@ -6,9 +6,12 @@ from enum import IntEnum, IntFlag
 from dataclasses import dataclass
 from dataclasses import field
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.conf import settings
+from asgiref.sync import sync_to_async
 
 from achievements.models import User
+from .session import queue_packets, pop_packets
 
 
 # dataclasses
@@ -165,12 +168,19 @@ class ModeData:
 # models
 
 
+RECENT_SCORES_LIMIT = 100
+
+# shared by every account, so not to be modified
+PLACEHOLDER_GEOLOC = {"latitude": 0, "longitude": 0, "country": {"acronym": "jp", "numeric": 111}}
+PLACEHOLDER_STATUS = Status()
+PLACEHOLDER_MODE_DATA = ModeData()
+
+
 class PlaytestAccount(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     passkey = models.CharField(max_length=32)
     osu_token = models.CharField(max_length=256)
     utc_offset = models.SmallIntegerField(default=0)
-    recent_scores = models.JSONField(default=list)
     response_data = models.BinaryField(default=b"")  # will be sent with next request from player
 
     def __init__(self, *args, **kwargs):
@@ -190,7 +200,7 @@ class PlaytestAccount(models.Model):
 
     @property
     def geoloc(self):
-        return {"latitude": 0, "longitude": 0, "country": {"acronym": "jp", "numeric": 111}}
+        return PLACEHOLDER_GEOLOC
 
     @property
     def bancho_priv(self):
@@ -198,27 +208,79 @@ class PlaytestAccount(models.Model):
 
     @property
     def status(self):
-        return Status()
+        return PLACEHOLDER_STATUS
 
     @property
     def gm_stats(self):
-        return ModeData()
+        return PLACEHOLDER_MODE_DATA
+
+    def _add_recent_score(self, checksum: str, data: dict) -> bool:
+        try:
+            with transaction.atomic():
+                PlaytestScore.objects.create(account=self, checksum=checksum, data=data)
+        except IntegrityError:
+            return False
+
+        # only the newest scores are kept
+        ids = self.recent_scores.order_by("-id").values_list("id", flat=True)
+        cutoff = list(ids[RECENT_SCORES_LIMIT : RECENT_SCORES_LIMIT + 1])
+        if len(cutoff) > 0:
+            self.recent_scores.filter(id__lte=cutoff[0]).delete()
+
+        return True
+
+    async def add_recent_score(self, checksum: str, data: dict) -> bool:
+        """Returns False if a score with the same checksum is already in the recent scores"""
+        # transactions aren't supported by the async orm, so the whole thing runs in one go
+        return await sync_to_async(self._add_recent_score)(checksum, data)
+
+    async def get_recent_scores(self) -> list[dict]:
+        return [data async for data in self.recent_scores.order_by("id").values_list("data", flat=True)]
+
+    def session_data(self) -> dict:
+        return {"id": self.id, "user_id": self.user_id, "username": self.user.username, "utc_offset": self.utc_offset}
+
+    @classmethod
+    def from_session_data(cls, data: dict) -> PlaytestAccount:
+        """An unsaved account with just enough data for handling packets"""
+        account = cls(id=data["id"], user_id=data["user_id"], utc_offset=data["utc_offset"])
+        account.user = User(id=data["user_id"], username=data["username"])
+        return account
 
     def add_packet(self, data: bytes):
         self._response_data += data
 
-    def save_packet(self, data: bytes):
+    async def save_packet(self, data: bytes):
+        if not settings.DEBUG:
+            # redis-py calls block, so they run in a worker thread
+            await sync_to_async(queue_packets, thread_sensitive=False)(self.id, data)
+            return
+
         self.response_data += data
-        self.save()
+        await self.asave(update_fields=["response_data"])
+
+    async def get_response_data(self):
+        if not settings.DEBUG:
+            return await sync_to_async(pop_packets, thread_sensitive=False)(self.id) + self._response_data
 
-    def get_response_data(self):
         if len(self.response_data) > 0:
             response_data = self.response_data + self._response_data
             self.response_data = b""
-            self.save()
+            await self.asave(update_fields=["response_data"])
             return response_data
         return self._response_data
 
 
+class PlaytestScore(models.Model):
+    account = models.ForeignKey(PlaytestAccount, on_delete=models.CASCADE, related_name="recent_scores")
+    checksum = models.CharField(max_length=64)
+    data = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["account", "checksum"], name="unique_playtest_score"),
+        ]
+
+
 class Match:
     pass
@@ -0,0 +1,72 @@
+"""
+Decryption of the fields in score submissions.
+
+The client encrypts them with Rijndael using 256-bit blocks in CBC mode, which isn't AES,
+so py3rijndael is used for the key schedule and tables and the block rounds are done here.
+"""
+
+from py3rijndael import Rijndael
+from py3rijndael.constants import shifts, Si, T5, T6, T7, T8
+
+import struct
+from functools import lru_cache
+
+
+__all__ = ("decrypt_score_fields",)
+
+
+BLOCK_SIZE = 32
+BLOCK_WORDS = BLOCK_SIZE // 4
+# a few versions are in use at once (e.g. stable and cutting edge)
+KEY_CACHE_SIZE = 16
+
+# for each column: itself and the columns that each row is read from after undoing the row shifts
+_COLUMNS = tuple((i, *((i + shifts[2][row][1]) % BLOCK_WORDS for row in (1, 2, 3))) for i in range(BLOCK_WORDS))
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _key_schedule(osu_version: str) -> tuple[tuple[int, ...], ...]:
+    # the key is the only thing that depends on the version, and the schedule is the slow part
+    cipher = Rijndael(f"osu!-scoreburgr---------{osu_version}".encode(), block_size=BLOCK_SIZE)
+    return tuple(map(tuple, cipher.Kd))
+
+
+def _decrypt_words(k_d: tuple[tuple[int, ...], ...], words: tuple[int, ...], prev: tuple[int, ...]) -> list[int]:
+    k_first, k_last = k_d[0], k_d[-1]
+    k_middle = k_d[1:-1]
+
+    out = []
+    for offset in range(0, len(words), BLOCK_WORDS):
+        block = words[offset : offset + BLOCK_WORDS]
+        t = [word ^ key for word, key in zip(block, k_first)]
+        for k in k_middle:
+            t = [
+                T5[t[a] >> 24] ^ T6[(t[b] >> 16) & 0xFF] ^ T7[(t[c] >> 8) & 0xFF] ^ T8[t[d] & 0xFF] ^ k[a]
+                for a, b, c, d in _COLUMNS
+            ]
+        out.extend(
+            (Si[t[a] >> 24] << 24 | Si[(t[b] >> 16) & 0xFF] << 16 | Si[(t[c] >> 8) & 0xFF] << 8 | Si[t[d] & 0xFF])
+            ^ k_last[a]
+            ^ prev[a]
+            for a, b, c, d in _COLUMNS
+        )
+        prev = block
+
+    return out
+
+
+def _decrypt(osu_version: str, iv: bytes, data: bytes) -> bytes:
+    if len(data) == 0 or len(data) % BLOCK_SIZE != 0 or len(iv) != BLOCK_SIZE:
+        raise ValueError("score data isn't made of whole blocks")
+
+    n_words = len(data) // 4
+    words = struct.unpack(f">{n_words}I", data)
+    iv_words = struct.unpack(f">{BLOCK_WORDS}I", iv)
+    plain = struct.pack(f">{n_words}I", *_decrypt_words(_key_schedule(osu_version), words, iv_words))
+
+    # pkcs7 padding
+    return plain[: -plain[-1]]
+
+
+def decrypt_score_fields(osu_version: str, iv: bytes, *fields: bytes) -> list[bytes]:
+    return [_decrypt(osu_version, iv, field) for field in fields]
@@ -1,7 +1,7 @@
-from py3rijndael import Pkcs7Padding
-from py3rijndael import RijndaelCbc
 from base64 import b64decode
 from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
+import asyncio
 import osu
 
 from django.http import HttpResponse
@@ -9,11 +9,12 @@ from django.http import HttpResponse
 from .. import packets
 from ..models import PlaytestAccount
 from ..util import account_from_credentials
-from common.osu_api import get_client
-from common.comm import submit_playtest_scores
+from .cipher import decrypt_score_fields
+from common.osu_api import get_user_data, lookup_beatmap_data
+from common.comm import asubmit_playtest_scores
 
 
-def empty_reply(req):
+async def empty_reply(req):
     return HttpResponse(b"")
 
 
@@ -27,19 +28,12 @@ def decrypt_score_aes_data(
 ) -> tuple[list[str], str]:
     """Decrypt the base64'ed score data."""
 
-    # attempt to decrypt score data
-    aes = RijndaelCbc(
-        key=f"osu!-scoreburgr---------{osu_version}".encode(),
-        iv=b64decode(iv_b64),
-        padding=Pkcs7Padding(32),
-        block_size=32,
+    score_data, client_hash_decoded = decrypt_score_fields(
+        osu_version, b64decode(iv_b64), b64decode(score_data_b64), b64decode(client_hash_b64)
     )
 
-    score_data = aes.decrypt(b64decode(score_data_b64)).decode().split(":")
-    client_hash_decoded = aes.decrypt(b64decode(client_hash_b64)).decode()
-
     # score data is delimited by colons (:).
-    return score_data, client_hash_decoded
+    return score_data.decode().split(":"), client_hash_decoded.decode()
 
 
 def calculate_accuracy(mode, n300, n100, n50, ngeki, nkatu, nmiss) -> float:
@@ -87,7 +81,19 @@ def chart_entry(name: str, before: float | None, after: float | None) -> str:
     return f"{name}Before:{before or ''}|{name}After:{after or ''}"
 
 
-def handle_score_submission(req):
+async def fetch_submission_data(account: PlaytestAccount, beatmap_hash: str, mode: int) -> tuple[dict | None, dict]:
+    """The beatmap and the user don't depend on each other, so they're fetched at the same time"""
+    # the osu! api calls don't use the database, so they don't need to wait on the main thread
+    beatmap, user = await asyncio.gather(
+        sync_to_async(lookup_beatmap_data, thread_sensitive=False)(beatmap_hash),
+        sync_to_async(get_user_data, thread_sensitive=False)(
+            account.user.id, osu.GameModeInt(mode).get_str_equivalent().value
+        ),
+    )
+    return beatmap, user
+
+
+async def handle_score_submission(req):
     score_data = req.POST.get("score")
     client_hash_b64 = req.POST.get("s")
     iv_b64 = req.POST.get("iv")
@@ -96,29 +102,27 @@ def handle_score_submission(req):
     if any(val is None for val in (score_data, client_hash_b64, iv_b64, osu_version, pw_md5)):
         return HttpResponse(b"error: invalid request", status=400)
 
-    score_data, client_hash_decoded = decrypt_score_aes_data(score_data.encode(), client_hash_b64, iv_b64, osu_version)
+    # cpu bound, so it's kept off the event loop
+    score_data, client_hash_decoded = await sync_to_async(decrypt_score_aes_data, thread_sensitive=False)(
+        score_data.encode(), client_hash_b64, iv_b64, osu_version
+    )
 
     beatmap_hash = score_data[0]
     username = score_data[1]
     if username[-1] == " ":
         username = username[:-1]
 
-    account = account_from_credentials(username, pw_md5.encode())
+    account = await account_from_credentials(username, pw_md5.encode())
     if account is None:
         return HttpResponse(b"error: not logged in", status=403)
 
-    osu_client = get_client()
-    try:
-        beatmap = osu_client.http.make_request(osu.Path.beatmap_lookup(), checksum=beatmap_hash)
-    except:
+    mode = int(score_data[15])
+    beatmap, user = await fetch_submission_data(account, beatmap_hash, mode)
+    if beatmap is None:
         return HttpResponse(b"error: unsubmitted map or something", status=400)
 
     client_checksum = score_data[2]
 
-    for score in account.recent_scores:
-        if score.get("checksum") == client_checksum:
-            return HttpResponse(b"error: no")
-
     n300 = int(score_data[3])
     n100 = int(score_data[4])
     n50 = int(score_data[5])
@@ -131,7 +135,6 @@ def handle_score_submission(req):
     grade = score_data[12]
     mods = osu.Mods(int(score_data[13]))
     passed = score_data[14] == "True"
-    mode = int(score_data[15])
     accuracy = calculate_accuracy(mode, n300, n100, n50, ngeki, nkatu, nmiss)
 
     score = {
@@ -174,19 +177,13 @@ def handle_score_submission(req):
         "checksum": client_checksum,
     }
 
-    account.recent_scores.append(score)
-    if len(account.recent_scores) > 100:
-        account.recent_scores.pop(0)
-    account.save()
-
-    user = osu_client.http.make_request(
-        osu.Path.get_user(account.user.id, osu.GameModeInt(mode).get_str_equivalent().value)
-    )
+    if not await account.add_recent_score(client_checksum, score):
+        return HttpResponse(b"error: no")
 
-    completions = submit_playtest_scores(user, account.recent_scores)
+    completions = await asubmit_playtest_scores(user, await account.get_recent_scores())
     if len(completions) > 0:
         completion_str = "; ".join(completion["achievement_name"] for completion in completions)
-        account.save_packet(packets.notification(f"Completed {len(completions)} achievements: {completion_str}"))
+        await account.save_packet(packets.notification(f"Completed {len(completions)} achievements: {completion_str}"))
 
     chart_entries = (
         chart_entry("rank", None, 1),
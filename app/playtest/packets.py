@@ -304,11 +304,31 @@ class BasePacket(ABC):
 PacketMap = dict[ClientPackets, type[BasePacket]]
 
 
+# precompiled readers for the reader's fixed-size types
+HEADER_FMT = struct.Struct("<HxI")
+I8_FMT = struct.Struct("<b")
+U8_FMT = struct.Struct("<B")
+I16_FMT = struct.Struct("<h")
+U16_FMT = struct.Struct("<H")
+I32_FMT = struct.Struct("<i")
+U32_FMT = struct.Struct("<I")
+I64_FMT = struct.Struct("<q")
+U64_FMT = struct.Struct("<Q")
+F16_FMT = struct.Struct("<e")
+F32_FMT = struct.Struct("<f")
+F64_FMT = struct.Struct("<d")
+REPLAYFRAME_FMT = struct.Struct("<BBffi")
+SCOREFRAME_FMT = struct.Struct("<iBHHHHHHiHH?BB?")
+
+
 class BanchoPacketReader:
     """\
     A class for reading bancho packets
     from the osu! client's request body.
 
+    Reads are done at an offset into the body,
+    so the body is never sliced or copied.
+
     Attributes
     -----------
     body_view: `memoryview`
@@ -317,7 +337,10 @@ class BanchoPacketReader:
     packet_map: `dict[ClientPackets, BasePacket]`
         The map of registered packets the reader may handle.
 
-    current_length: int
+    offset: int
+        The position of the next read in `body_view`.
+
+    current_len: int
         The length in bytes of the packet currently being handled.
 
     Intended Usage:
@@ -326,148 +349,128 @@ class BanchoPacketReader:
     ...         await packet.handle()
     """
 
+    __slots__ = ("body_view", "packet_map", "offset", "current_len", "_packet_end")
+
     def __init__(self, body_view: memoryview, packet_map: PacketMap) -> None:
         self.body_view = body_view  # readonly
         self.packet_map = packet_map
 
+        self.offset = 0
         self.current_len = 0  # last read packet's length
+        self._packet_end = 0
 
     def __iter__(self) -> Iterator[BasePacket]:
         return self
 
     def __next__(self) -> BasePacket:
-        # do not break until we've read the
-        # header of a packet we can handle.
-        p_type = ClientPackets.UNKNOWN_PACKET
-        p_len = 0
-        while self.body_view:  # len(self.view) < 7?
-            p_type, p_len = self._read_header()
-
-            if p_type not in self.packet_map:
-                print("Packet type not handled:", p_type.name)
-                # packet type not handled, remove
-                # from internal buffer and continue.
-                if p_len != 0:
-                    self.body_view = self.body_view[p_len:]
-            else:
-                # we can handle this one.
-                break
-        else:
-            raise StopIteration
-
-        # we have a packet handler for this.
-        packet_cls = self.packet_map[p_type]
-        self.current_len = p_len
+        # continue after the previous packet, however
+        # much of it its handler actually read.
+        offset = self._packet_end
+        end = len(self.body_view) - HEADER_FMT.size
+        while offset <= end:
+            p_type, p_len = HEADER_FMT.unpack_from(self.body_view, offset)
+            offset += HEADER_FMT.size
+
+            # packet types we don't handle (or don't know) are skipped
+            packet_cls = self.packet_map.get(p_type)
+            if packet_cls is None:
+                offset += p_len
+                continue
+
+            self.offset = offset
+            self.current_len = p_len
+            self._packet_end = offset + p_len
+            return packet_cls(self)
+
+        self._packet_end = offset
+        raise StopIteration
 
-        return packet_cls(self)
+    """ public API (exposed for packet handler's __init__ methods) """
 
-    def _read_header(self) -> tuple[ClientPackets, int]:
-        """Read the header of an osu! packet (id & length)."""
-        # read type & length from the body
-        data = struct.unpack("<HxI", self.body_view[:7])
-        self.body_view = self.body_view[7:]
-        return ClientPackets(data[0]), data[1]
+    def read_struct(self, fmt: struct.Struct) -> tuple[Any, ...]:
+        """Read several fixed-size values at once, laid out as `fmt`."""
+        val = fmt.unpack_from(self.body_view, self.offset)
+        self.offset += fmt.size
+        return val
 
-    """ public API (exposed for packet handler's __init__ methods) """
+    def _read(self, fmt: struct.Struct) -> Any:
+        (val,) = fmt.unpack_from(self.body_view, self.offset)
+        self.offset += fmt.size
+        return val
 
     def read_raw(self) -> memoryview:
-        val = self.body_view[: self.current_len]
-        self.body_view = self.body_view[self.current_len :]
+        val = self.body_view[self.offset : self.offset + self.current_len]
+        self.offset += self.current_len
         return val
 
     # integral types
 
     def read_i8(self) -> int:
-        val = self.body_view[0]
-        self.body_view = self.body_view[1:]
-        return val - 256 if val > 127 else val
+        return self._read(I8_FMT)
 
     def read_u8(self) -> int:
-        val = self.body_view[0]
-        self.body_view = self.body_view[1:]
+        val = self.body_view[self.offset]
+        self.offset += 1
         return val
 
     def read_i16(self) -> int:
-        val = int.from_bytes(self.body_view[:2], "little", signed=True)
-        self.body_view = self.body_view[2:]
-        return val
+        return self._read(I16_FMT)
 
     def read_u16(self) -> int:
-        val = int.from_bytes(self.body_view[:2], "little", signed=False)
-        self.body_view = self.body_view[2:]
-        return val
+        return self._read(U16_FMT)
 
     def read_i32(self) -> int:
-        val = int.from_bytes(self.body_view[:4], "little", signed=True)
-        self.body_view = self.body_view[4:]
-        return val
+        return self._read(I32_FMT)
 
     def read_u32(self) -> int:
-        val = int.from_bytes(self.body_view[:4], "little", signed=False)
-        self.body_view = self.body_view[4:]
-        return val
+        return self._read(U32_FMT)
 
     def read_i64(self) -> int:
-        val = int.from_bytes(self.body_view[:8], "little", signed=True)
-        self.body_view = self.body_view[8:]
-        return val
+        return self._read(I64_FMT)
 
     def read_u64(self) -> int:
-        val = int.from_bytes(self.body_view[:8], "little", signed=False)
-        self.body_view = self.body_view[8:]
-        return val
+        return self._read(U64_FMT)
 
     # floating-point types
 
     def read_f16(self) -> float:
-        (val,) = struct.unpack_from("<e", self.body_view[:2])
-        self.body_view = self.body_view[2:]
-        return cast(float, val)
+        return cast(float, self._read(F16_FMT))
 
     def read_f32(self) -> float:
-        (val,) = struct.unpack_from("<f", self.body_view[:4])
-        self.body_view = self.body_view[4:]
-        return cast(float, val)
+        return cast(float, self._read(F32_FMT))
 
     def read_f64(self) -> float:
-        (val,) = struct.unpack_from("<d", self.body_view[:8])
-        self.body_view = self.body_view[8:]
-        return cast(float, val)
+        return cast(float, self._read(F64_FMT))
 
     # complex types
 
     # XXX: some osu! packets use i16 for
     # array length, while others use i32
     def read_i32_list_i16l(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:2], "little")
-        self.body_view = self.body_view[2:]
-
-        val = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
-        return val
+        length = self._read(U16_FMT)
+        return self.read_struct(_i32_list_fmt(length))
 
     def read_i32_list_i32l(self) -> tuple[int, ...]:
-        length = int.from_bytes(self.body_view[:4], "little")
-        self.body_view = self.body_view[4:]
-
-        val = struct.unpack(f'<{"I" * length}', self.body_view[: length * 4])
-        self.body_view = self.body_view[length * 4 :]
-        return val
+        length = self._read(U32_FMT)
+        return self.read_struct(_i32_list_fmt(length))
 
     def read_string(self) -> str:
-        exists = self.body_view[0] == 0x0B
-        self.body_view = self.body_view[1:]
+        view = self.body_view
+        offset = self.offset
+        exists = view[offset] == 0x0B
+        offset += 1
 
         if not exists:
             # no string sent.
+            self.offset = offset
             return ""
 
         # non-empty string, decode str length (uleb128)
         length = shift = 0
 
         while True:
-            byte = self.body_view[0]
-            self.body_view = self.body_view[1:]
+            byte = view[offset]
+            offset += 1
 
             length |= (byte & 0x7F) << shift
             if (byte & 0x80) == 0:
@@ -475,8 +478,8 @@ class BanchoPacketReader:
 
             shift += 7
 
-        val = self.body_view[:length].tobytes().decode()  # copy
-        self.body_view = self.body_view[length:]
+        val = str(view[offset : offset + length], "utf-8")  # copy
+        self.offset = offset + length
         return val
 
     # custom osu! types
@@ -510,8 +513,8 @@ class BanchoPacketReader:
             map_name=self.read_string(),
             map_id=self.read_i32(),
             map_md5=self.read_string(),
-            slot_statuses=[self.read_i8() for _ in range(16)],
-            slot_teams=[self.read_i8() for _ in range(16)],
+            slot_statuses=list(self.read_struct(SLOT_BYTES_FMT)),
+            slot_teams=list(self.read_struct(SLOT_BYTES_FMT)),
             # ^^ up to slot_ids, as it relies on slot_statuses ^^
         )
 
@@ -526,15 +529,14 @@ class BanchoPacketReader:
         match.freemods = self.read_i8() == 1
 
         if match.freemods:
-            match.slot_mods = [self.read_i32() for _ in range(16)]
+            match.slot_mods = list(self.read_struct(SLOT_MODS_FMT))
 
         match.seed = self.read_i32()  # used for mania random mod
 
         return match
 
     def read_scoreframe(self) -> ScoreFrame:
-        sf = ScoreFrame(*SCOREFRAME_FMT.unpack_from(self.body_view[:29]))
-        self.body_view = self.body_view[29:]
+        sf = ScoreFrame(*self.read_struct(SCOREFRAME_FMT))
 
         if sf.score_v2:
             sf.combo_portion = self.read_f64()
@@ -543,17 +545,12 @@ class BanchoPacketReader:
         return sf
 
     def read_replayframe(self) -> ReplayFrame:
-        return ReplayFrame(
-            button_state=self.read_u8(),
-            taiko_byte=self.read_u8(),  # pre-taiko support (<=2008)
-            x=self.read_f32(),
-            y=self.read_f32(),
-            time=self.read_i32(),
-        )
+        # button_state, taiko_byte (pre-taiko support (<=2008)), x, y, time
+        return ReplayFrame(*self.read_struct(REPLAYFRAME_FMT))
 
     def read_replayframe_bundle(self) -> ReplayFrameBundle:
         # save raw format to distribute to the other clients
-        raw_data = self.body_view[: self.current_len]
+        raw_data = self.body_view[self.offset : self.offset + self.current_len]
 
         extra = self.read_i32()  # bancho proto >= 18
         framecount = self.read_u16()
@@ -565,6 +562,15 @@ class BanchoPacketReader:
         return ReplayFrameBundle(frames, scoreframe, action, extra, sequence, raw_data)
 
 
+SLOT_BYTES_FMT = struct.Struct("<16b")
+SLOT_MODS_FMT = struct.Struct("<16i")
+
+
+@lru_cache(maxsize=64)
+def _i32_list_fmt(length: int) -> struct.Struct:
+    return struct.Struct(f"<{length}I")
+
+
 # write functions
 
 
@@ -677,9 +683,6 @@ def write_match(m: Match, send_pw: bool = True) -> bytearray:
     return ret
 
 
-SCOREFRAME_FMT = struct.Struct("<iBHHHHHHiHH?BB?")
-
-
 def write_scoreframe(s: ScoreFrame) -> bytes:
     """Write `s` into bytes (osu! scoreframe)."""
     return SCOREFRAME_FMT.pack(
@@ -701,49 +704,103 @@ def write_scoreframe(s: ScoreFrame) -> bytes:
     )
 
 
-_noexpand_types: dict[osuTypes, Callable[..., bytes]] = {
-    # base
-    osuTypes.i8: struct.Struct("<b").pack,
-    osuTypes.u8: struct.Struct("<B").pack,
-    osuTypes.i16: struct.Struct("<h").pack,
-    osuTypes.u16: struct.Struct("<H").pack,
-    osuTypes.i32: struct.Struct("<i").pack,
-    osuTypes.u32: struct.Struct("<I").pack,
-    # osuTypes.f16: struct.Struct('<e').pack, # futureproofing
-    osuTypes.f32: struct.Struct("<f").pack,
-    osuTypes.i64: struct.Struct("<q").pack,
-    osuTypes.u64: struct.Struct("<Q").pack,
-    osuTypes.f64: struct.Struct("<d").pack,
+# fixed-size types; next to each other, they get packed with a single Struct
+_fixed_formats: dict[osuTypes, str] = {
+    osuTypes.i8: "b",
+    osuTypes.u8: "B",
+    osuTypes.i16: "h",
+    osuTypes.u16: "H",
+    osuTypes.i32: "i",
+    osuTypes.u32: "I",
+    # osuTypes.f16: "e", # futureproofing
+    osuTypes.f32: "f",
+    osuTypes.i64: "q",
+    osuTypes.u64: "Q",
+    osuTypes.f64: "d",
+}
+
+_writers: dict[osuTypes, Callable[[Any], bytes | bytearray | memoryview]] = {
+    osuTypes.raw: lambda data: data,
     # more complex
     osuTypes.string: write_string,
     osuTypes.i32_list: write_i32_list,
     osuTypes.scoreframe: write_scoreframe,
     # not (yet?) implemented: write replayframe & bundle
-}
-
-_expand_types: dict[osuTypes, Callable[..., bytearray]] = {
     # multiarg, tuple expansion
-    osuTypes.message: write_message,
-    osuTypes.channel: write_channel,
-    osuTypes.match: write_match,
+    osuTypes.message: lambda args: write_message(*args),
+    osuTypes.channel: lambda args: write_channel(*args),
+    osuTypes.match: lambda args: write_match(*args),
 }
 
 
-def write(packid: int, *args: tuple[Any, osuTypes]) -> bytes:
-    """Write `args` into bytes."""
-    ret = bytearray(struct.pack("<Hx", packid))
+@lru_cache(maxsize=256)
+def _compile_layout(types: tuple[osuTypes, ...]) -> tuple[tuple[Callable[..., Any] | None, int, bool], ...]:
+    """\
+    Turn the argument types of a packet into steps of
+    (write function, number of arguments, whether the arguments are spread).
+    """
+    steps = []
+    fmt = ""
+    for p_type in types:
+        if p_type in _fixed_formats:
+            fmt += _fixed_formats[p_type]
+            continue
+
+        if fmt:
+            steps.append((struct.Struct("<" + fmt).pack, len(fmt), True))
+            fmt = ""
+        # types without a writer are skipped
+        steps.append((_writers.get(p_type), 1, False))
+
+    if fmt:
+        steps.append((struct.Struct("<" + fmt).pack, len(fmt), True))
+
+    return tuple(steps)
+
+
+class PacketWriter:
+    """\
+    Writes packets one after another into a single buffer.
 
-    for p_args, p_type in args:
-        if p_type == osuTypes.raw:
-            ret += p_args
-        elif p_type in _noexpand_types:
-            ret += _noexpand_types[p_type](p_args)
-        elif p_type in _expand_types:
-            ret += _expand_types[p_type](*p_args)
+    Intended Usage:
+    >>> data = PacketWriter().add(pong()).write(ServerPackets.RESTART, (0, osuTypes.i32)).getvalue()
+    """
+
+    __slots__ = ("buf",)
+
+    def __init__(self) -> None:
+        self.buf = bytearray()
+
+    def write(self, packid: int, *args: tuple[Any, osuTypes]) -> PacketWriter:
+        """Write a packet with `args` as its data."""
+        buf = self.buf
+        start = len(buf)
+        # the length is filled in once the data is written
+        buf += HEADER_FMT.pack(packid, 0)
 
-    # add size
-    ret[3:3] = struct.pack("<I", len(ret) - 3)
-    return bytes(ret)
+        if args:
+            values, p_types = zip(*args)
+            i = 0
+            for write_fn, n_args, spread in _compile_layout(p_types):
+                if write_fn is not None:
+                    buf += write_fn(*values[i : i + n_args]) if spread else write_fn(values[i])
+                i += n_args
+
+        U32_FMT.pack_into(buf, start + 3, len(buf) - start - HEADER_FMT.size)
+        return self
+
+    def add(self, data: bytes) -> PacketWriter:
+        """Add an already written packet."""
+        self.buf += data
+        return self
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buf)
+
+
+def write(packid: int, *args: tuple[Any, osuTypes]) -> bytes:
+    """Write `args` into bytes."""
+    return PacketWriter().write(packid, *args).getvalue()
 
 
 #
@@ -839,6 +896,9 @@ def bot_stats(player: PlaytestAccount) -> bytes:
 
 
 # packet id: 11
+# keyed on everything that goes into the packet, so it's rebuilt
+# when a player's username, utc offset, status or stats change
+@lru_cache(maxsize=1024)
 def _user_stats(
     user_id: int,
     action: int,
@@ -879,31 +939,22 @@ def _user_stats(
 
 
 def user_stats(player: PlaytestAccount) -> bytes:
+    status = player.status
     gm_stats = player.gm_stats
-    if gm_stats.pp > 0xFFFF:
-        # HACK: if pp is over osu!'s ingame cap,
-        # we can instead display it as ranked score
-        rscore = gm_stats.pp
-        pp = 0
-    else:
-        rscore = gm_stats.rscore
-        pp = gm_stats.pp
-
-    return write(
-        ServerPackets.USER_STATS,
-        (player.id, osuTypes.i32),
-        (player.status.action, osuTypes.u8),
-        (player.status.info_text, osuTypes.string),
-        (player.status.map_md5, osuTypes.string),
-        (player.status.mods, osuTypes.i32),
-        (player.status.mode.as_vanilla, osuTypes.u8),
-        (player.status.map_id, osuTypes.i32),
-        (rscore, osuTypes.i64),
-        (gm_stats.acc / 100.0, osuTypes.f32),
-        (gm_stats.plays, osuTypes.i32),
-        (gm_stats.tscore, osuTypes.i64),
-        (gm_stats.rank, osuTypes.i32),
-        (pp, osuTypes.u16),
+    return _user_stats(
+        player.id,
+        status.action,
+        status.info_text,
+        status.map_md5,
+        status.mods,
+        status.mode.as_vanilla,
+        status.map_id,
+        gm_stats.rscore,
+        gm_stats.acc,
+        gm_stats.plays,
+        gm_stats.tscore,
+        gm_stats.rank,
+        gm_stats.pp,
     )
 
 
@@ -1149,6 +1200,7 @@ def bot_presence(player: PlaytestAccount) -> bytes:
 
 
 # packet id: 83
+@lru_cache(maxsize=1024)
 def _user_presence(
     user_id: int,
     name: str,
@@ -1174,16 +1226,17 @@ def _user_presence(
 
 
 def user_presence(player: PlaytestAccount) -> bytes:
-    return write(
-        ServerPackets.USER_PRESENCE,
-        (player.user.id, osuTypes.i32),
-        (player.user.username, osuTypes.string),
-        (player.utc_offset + 24, osuTypes.u8),
-        (player.geoloc["country"]["numeric"], osuTypes.u8),
-        (player.bancho_priv | (player.status.mode.as_vanilla << 5), osuTypes.u8),
-        (player.geoloc["longitude"], osuTypes.f32),
-        (player.geoloc["latitude"], osuTypes.f32),
-        (player.gm_stats.rank, osuTypes.i32),
+    geoloc = player.geoloc
+    return _user_presence(
+        player.user.id,
+        player.user.username,
+        player.utc_offset,
+        geoloc["country"]["numeric"],
+        player.bancho_priv,
+        player.status.mode.as_vanilla,
+        geoloc["latitude"],
+        geoloc["longitude"],
+        player.gm_stats.rank,
     )
 
 
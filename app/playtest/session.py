@@ -0,0 +1,76 @@
+from django.conf import settings
+
+from asgiref.sync import sync_to_async
+
+from common.osu_api import redis_client
+
+import json
+
+
+__all__ = (
+    "set_session",
+    "get_session",
+    "delete_session",
+    "aset_session",
+    "aget_session",
+    "adelete_session",
+    "queue_packets",
+    "pop_packets",
+)
+
+
+# osu token -> the account data needed to handle a poll
+KEY_SESSION = "playtest-session:{osu_token}"
+# packets waiting to be sent with the player's next poll
+KEY_PACKETS = "playtest-packets:{account_id}"
+
+# sessions are recreated from the database when missing, so this only bounds memory
+SESSION_TTL = 60 * 60
+# in case the player stopped polling
+PACKETS_TTL = 60 * 10
+
+
+def set_session(osu_token: str, data: dict):
+    if settings.DEBUG:
+        return
+
+    redis_client.set(KEY_SESSION.format(osu_token=osu_token), json.dumps(data), ex=SESSION_TTL)
+
+
+def get_session(osu_token: str) -> dict | None:
+    if settings.DEBUG:
+        return
+
+    data = redis_client.get(KEY_SESSION.format(osu_token=osu_token))
+    if data is not None:
+        return json.loads(data)
+
+
+def delete_session(osu_token: str):
+    if settings.DEBUG:
+        return
+
+    redis_client.delete(KEY_SESSION.format(osu_token=osu_token))
+
+
+# redis-py calls block, so async views use these to make them in a worker thread
+aset_session = sync_to_async(set_session, thread_sensitive=False)
+aget_session = sync_to_async(get_session, thread_sensitive=False)
+adelete_session = sync_to_async(delete_session, thread_sensitive=False)
+
+
+def queue_packets(account_id: int, data: bytes):
+    key = KEY_PACKETS.format(account_id=account_id)
+    pipe = redis_client.pipeline()
+    pipe.append(key, data)
+    pipe.expire(key, PACKETS_TTL)
+    pipe.execute()
+
+
+def pop_packets(account_id: int) -> bytes:
+    key = KEY_PACKETS.format(account_id=account_id)
+    pipe = redis_client.pipeline()
+    pipe.get(key)
+    pipe.delete(key)
+    data, _ = pipe.execute()
+    return data or b""
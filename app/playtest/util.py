@@ -1,10 +1,11 @@
 import hashlib
 
 from .models import PlaytestAccount
+from .session import aset_session, aget_session
 
 
-def account_from_credentials(username: str, password_md5: bytes):
-    account = PlaytestAccount.objects.select_related("user").filter(user__username=username).first()
+async def account_from_credentials(username: str, password_md5: bytes):
+    account = await PlaytestAccount.objects.select_related("user").filter(user__username=username).afirst()
     if account is None:
         return
 
@@ -12,3 +13,15 @@ def account_from_credentials(username: str, password_md5: bytes):
         return
 
     return account
+
+
+async def account_from_token(osu_token: str):
+    data = await aget_session(osu_token)
+    if data is not None:
+        return PlaytestAccount.from_session_data(data)
+
+    account = await PlaytestAccount.objects.select_related("user").filter(osu_token=osu_token).afirst()
+    if account is not None:
+        await aset_session(osu_token, account.session_data())
+
+    return account
@@ -0,0 +1,73 @@
+"""
+Measures how fast BanchoPacketReader gets through client poll bodies.
+
+python scripts/benchmark_packet_reader.py [captured body files...]
+
+Each file should be the raw body of one request to the cho server. Without any
+files, a few bodies resembling what the osu! client sends while idle/playing are used.
+"""
+
+import django
+import os
+import struct
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["DJANGO_SETTINGS_MODULE"] = "app.settings"
+django.setup()
+
+
+from playtest.packets import BanchoPacketReader, ClientPackets, write_string
+from playtest.cho.views import PACKETS
+
+
+ITERATIONS = 20000
+
+
+def packet(packet_type: ClientPackets, data: bytes = b"") -> bytes:
+    return struct.pack("<HxI", packet_type, len(data)) + data
+
+
+def change_action(action: int, info_text: str, map_md5: str, mods: int, mode: int, map_id: int) -> bytes:
+    data = struct.pack("<B", action) + write_string(info_text) + write_string(map_md5)
+    return packet(ClientPackets.CHANGE_ACTION, data + struct.pack("<IBi", mods, mode, map_id))
+
+
+def sample_bodies() -> list[bytes]:
+    stats_request = packet(ClientPackets.USER_STATS_REQUEST, struct.pack("<H3i", 3, 2, 3, 4))
+    return [
+        packet(ClientPackets.PING),
+        packet(ClientPackets.REQUEST_STATUS_UPDATE) + packet(ClientPackets.PING),
+        change_action(2, "artist - title [diff]", "0" * 32, 72, 0, 123456) + stats_request,
+        b"".join(packet(ClientPackets.PING) for _ in range(32)),
+    ]
+
+
+def main():
+    bodies = []
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            bodies.append(f.read())
+    if len(bodies) == 0:
+        bodies = sample_bodies()
+
+    for i, body in enumerate(bodies):
+        n_packets = 0
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            with memoryview(body) as body_view:
+                for _ in BanchoPacketReader(body_view, PACKETS):
+                    n_packets += 1
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"body {i} ({len(body)} bytes): {ITERATIONS / elapsed:10.0f} polls/s, "
+            f"{elapsed / ITERATIONS * 1e6:6.2f} us/poll, {n_packets // ITERATIONS} handled packets/poll"
+        )
+
+
+if __name__ == "__main__":
+    main()
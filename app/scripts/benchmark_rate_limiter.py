@@ -0,0 +1,93 @@
+"""
+Compares the throughput of the rate limiter against the lock based one it replaced,
+with several processes (like gunicorn workers) calling wait() at the same time.
+The limit is set high enough that nothing sleeps, so only the limiter's own overhead is measured.
+
+python scripts/benchmark_rate_limiter.py [workers] [seconds]
+"""
+
+import django
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["DJANGO_SETTINGS_MODULE"] = "app.settings"
+django.setup()
+
+
+from common.osu_api import RateLimitHandler, redis_client
+
+
+KEY_REQUESTS = "benchmark-rate-limiter-requests"
+LIMIT = 1_000_000_000
+
+
+class ScriptRateLimitHandler(RateLimitHandler):
+    KEY_REQUESTS = KEY_REQUESTS
+
+
+# the previous implementation, with wait time 0
+class LockedRateLimitHandler:
+    def __init__(self, limit_per_minute: int):
+        self.limit = limit_per_minute
+        self._lock = redis_client.lock("BenchmarkRateLimiterLock1")
+        self._waiting_lock = redis_client.lock("BenchmarkRateLimiterLock2")
+
+    def wait(self):
+        self._lock.acquire()
+
+        if len(self._get_requests_sent()) >= self.limit:
+            self._lock.release()
+            self._waiting_lock.acquire()
+            self._lock.acquire()
+
+            if len(requests_sent := self._get_requests_sent()) >= self.limit:
+                wait_time = max(0.0, 60.0 - (time.time() - requests_sent[0]))
+                if wait_time > 0:
+                    self._lock.release()
+                    time.sleep(wait_time)
+                    self._lock.acquire()
+
+            self._waiting_lock.release()
+
+        redis_client.zadd(KEY_REQUESTS, {str(time.time()): time.time()})
+
+        self._lock.release()
+
+    def _get_requests_sent(self):
+        redis_client.zremrangebyscore(KEY_REQUESTS, 0, time.time() - 60)
+        return list(map(float, redis_client.zrange(KEY_REQUESTS, 0, -1)))
+
+
+def run_worker(args):
+    name, seconds = args
+    limiter = ScriptRateLimitHandler(0, LIMIT) if name == "script" else LockedRateLimitHandler(LIMIT)
+
+    calls = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        limiter.wait()
+        calls += 1
+
+    return calls
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+
+    for name in ("locked", "script"):
+        redis_client.delete(KEY_REQUESTS)
+        with Pool(workers) as pool:
+            calls = sum(pool.map(run_worker, [(name, seconds)] * workers))
+        print(f"{name:>6}: {calls / seconds:10.1f} calls/s ({workers} workers, {calls} calls)")
+
+    redis_client.delete(KEY_REQUESTS, "BenchmarkRateLimiterLock1", "BenchmarkRateLimiterLock2")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares decrypting score submissions with decrypt_score_fields against
+building a py3rijndael RijndaelCbc for every submission, like it was done before.
+
+python scripts/benchmark_score_decrypt.py [iterations]
+"""
+
+import django
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["DJANGO_SETTINGS_MODULE"] = "app.settings"
+django.setup()
+
+
+from py3rijndael import Pkcs7Padding, RijndaelCbc
+
+from playtest.osu import cipher
+
+
+OSU_VERSION = "20250107"
+KEY = f"osu!-scoreburgr---------{OSU_VERSION}".encode()
+
+SCORE_DATA = (
+    b"0123456789abcdef0123456789abcdef:username :fedcba9876543210fedcba9876543210:"
+    b"727:27:7:72:2:0:12345678:1234:False:A:72:True:0:250107123456:20250107:1"
+)
+CLIENT_HASH = b":".join(
+    [b"0123456789abcdef0123456789abcdef", b"runningunderwine.0a.1b.2c.3d.4e.5f." * 4]
+    + [b"fedcba9876543210fedcba9876543210"] * 3
+)
+
+
+def old_decrypt(iv: bytes, fields: list[bytes]) -> list[bytes]:
+    aes = RijndaelCbc(key=KEY, iv=iv, padding=Pkcs7Padding(32), block_size=32)
+    return [aes.decrypt(field) for field in fields]
+
+
+def new_decrypt(iv: bytes, fields: list[bytes]) -> list[bytes]:
+    return cipher.decrypt_score_fields(OSU_VERSION, iv, *fields)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    iv = os.urandom(32)
+    aes = RijndaelCbc(key=KEY, iv=iv, padding=Pkcs7Padding(32), block_size=32)
+    fields = [aes.encrypt(SCORE_DATA), aes.encrypt(CLIENT_HASH)]
+    print(f"field sizes: {', '.join(f'{len(field) // 32} blocks' for field in fields)}")
+
+    for name, func in (("py3rijndael", old_decrypt), ("cached key", new_decrypt)):
+        assert func(iv, fields) == [SCORE_DATA, CLIENT_HASH]
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(iv, fields)
+        elapsed = time.perf_counter() - start
+
+        print(f"{name:>11}: {elapsed / iterations * 1e6:8.0f} us/submission")
+
+
+if __name__ == "__main__":
+    main()
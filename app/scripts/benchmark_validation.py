@@ -0,0 +1,84 @@
+"""
+Measures decoding and validating create_achievement request bodies with different amounts of beatmaps.
+
+python scripts/benchmark_validation.py [beatmap counts...]
+"""
+
+import django
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ["DJANGO_SETTINGS_MODULE"] = "app.settings"
+django.setup()
+
+
+from achievements.views import util
+from common.validation import *
+
+
+# same as the one on create_achievement
+ACHIEVEMENT_FORMAT = DictionaryType(
+    {
+        "name": StringType(min_length=1, max_length=128),
+        "description": StringType(min_length=1, max_length=2048),
+        "solution": StringType(max_length=2048),
+        "tags": StringType(max_length=128),
+        "change_note": StringType(max_length=512, optional=True),
+        "beatmaps": ListType(
+            DictionaryType({"id": IntegerType(), "hide": BoolType()}),
+            unique=True,
+            unique_key=lambda beatmap: beatmap["id"],
+        ),
+        "solution_algorithm": AnyType(),
+        "algorithm_enabled": BoolType(),
+    }
+)
+
+
+def make_body(n_beatmaps: int) -> bytes:
+    return json.dumps(
+        {
+            "name": "achievement",
+            "description": "description " * 50,
+            "solution": "solution " * 50,
+            "tags": "tag1,tag2",
+            "beatmaps": [{"id": 100000 + i, "hide": i % 2 == 0} for i in range(n_beatmaps)],
+            "solution_algorithm": {"type": "algorithm", "code": "x" * 512},
+            "algorithm_enabled": False,
+        }
+    ).encode("utf-8")
+
+
+def measure(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    counts = list(map(int, sys.argv[1:])) or [10, 1000, 10000]
+    validate = ACHIEVEMENT_FORMAT.compile()
+
+    decoders = [("json", lambda body: json.loads(body.decode("utf-8")))]
+    if util.orjson is not None:
+        decoders.append(("orjson", util.orjson.loads))
+
+    for n_beatmaps in counts:
+        body = make_body(n_beatmaps)
+        data = json.loads(body)
+        assert validate(data) is None
+        iterations = max(10, 100000 // (n_beatmaps + 10))
+
+        results = [f"{name} {measure(lambda: decode(body), iterations) * 1e6:8.0f} us" for name, decode in decoders]
+        results.append(f"validate {measure(lambda: validate(data), iterations) * 1e6:8.0f} us")
+        print(f"{n_beatmaps:6d} beatmaps ({len(body)} bytes): " + ", ".join(results))
+
+
+if __name__ == "__main__":
+    main()